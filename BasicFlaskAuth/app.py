@@ -1,8 +1,10 @@
 from flask import Flask, request, abort
 import json
+import os
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from jwks import KeyStore, JWKSError
 
 
 app = Flask(__name__)
@@ -10,6 +12,12 @@ app = Flask(__name__)
 AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
+# url or local file of the signing keys
+JWKS_SOURCE = os.environ.get(
+    'JWKS_SOURCE', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+# signing keys by kid, fetched once and refreshed in the background
+key_store = KeyStore(JWKS_SOURCE)
 
 
 class AuthError(Exception):
@@ -52,25 +60,20 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        rsa_key = key_store.get_key(unverified_header['kid'])
+    except JWKSError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to load the signing keys.'
+        }, 503)
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -111,6 +114,11 @@ def requires_auth(f):
         token = get_token_auth_header()
         try:
             payload = verify_decode_jwt(token)
+        except AuthError as e:
+            # keys could not be loaded, the token may be valid
+            if e.status_code == 503:
+                abort(503)
+            abort(401)
         except:
             abort(401)
         return f(payload, *args, **kwargs)
@@ -0,0 +1,148 @@
+import json
+import logging
+import re
+import threading
+import time
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+
+## JWKSError Exception
+'''
+JWKSError Exception
+raised when no signing keys could be loaded from the JWKS source
+'''
+class JWKSError(Exception):
+    pass
+
+
+## Key Store
+'''
+KeyStore(source)
+    signing keys of a JWKS document by key id (kid)
+    source is a url (http:// or https://) or the path of a local file,
+    e.g. https://tenant.auth0.com/.well-known/jwks.json or tests/jwks.json
+
+    keys are fetched on first use and kept max_age seconds (or the max-age
+    of the response Cache-Control header), a background thread fetches
+    them again refresh_before seconds before they expire.
+    an unknown kid fetches the keys again (at most once every
+    min_refetch_seconds, so random kids can not flood the source),
+    concurrent requests share a single fetch.
+    if a fetch fails the previous keys are kept
+'''
+class KeyStore:
+    def __init__(self, source, max_age=3600, refresh_before=300,
+                 min_refetch_seconds=30, timeout=5, background=True):
+        self.source = source
+        self.max_age = max_age
+        self.refresh_before = refresh_before
+        self.min_refetch_seconds = min_refetch_seconds
+        self.timeout = timeout
+        self.background = background
+        self.keys = {}
+        self.expires_at = None
+        # number and time of fetches, failed ones included
+        self.attempts = 0
+        self.attempted_at = None
+        self.fetch_lock = threading.Lock()
+        self.thread = None
+
+    '''
+    get_key(kid)
+        rsa key (a JWK dict) of kid, or None if the source has no such key
+        raises JWKSError if no keys could be loaded
+    '''
+    def get_key(self, kid):
+        key = self.keys.get(kid)
+        if key is None or (self.expired() and not self.refreshing()):
+            # first use, unknown kid (keys may have been rotated),
+            # or expired keys without background refresh
+            if self.attempted_at is None or time.monotonic() - \
+                    self.attempted_at >= self.min_refetch_seconds:
+                self.fetch(self.attempts)
+            elif key is None and self.fetch_lock.locked():
+                # a fetch is in flight, wait for its keys
+                with self.fetch_lock:
+                    pass
+            key = self.keys.get(kid)
+        if not self.keys:
+            raise JWKSError('Unable to load signing keys from ' + self.source)
+        return key
+
+    def expired(self):
+        return self.expires_at is not None \
+            and time.monotonic() >= self.expires_at
+
+    def refreshing(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    '''
+    fetch(attempts)
+        fetch the keys again, unless another thread did it since attempts
+        was read (single flight), a failed fetch keeps the previous keys
+    '''
+    def fetch(self, attempts):
+        with self.fetch_lock:
+            if self.attempts != attempts:
+                return
+            self.attempts += 1
+            self.attempted_at = time.monotonic()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning('fetching JWKS from %s failed: %s',
+                               self.source, e)
+            if self.background and self.keys and not self.refreshing():
+                self.start()
+
+    '''
+    refresh()
+        read the JWKS document and replace keys
+    '''
+    def refresh(self):
+        document, max_age = self.read()
+        keys = {}
+        for key in document['keys']:
+            if key.get('kty') != 'RSA' or 'kid' not in key:
+                continue
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use', 'sig'),
+                'n': key['n'],
+                'e': key['e']
+            }
+        self.keys = keys
+        self.expires_at = time.monotonic() + (
+            max_age if max_age is not None else self.max_age)
+
+    # JWKS document of the source, and max-age of the response if any
+    def read(self):
+        if self.source.startswith(('http://', 'https://')):
+            with urlopen(self.source, timeout=self.timeout) as response:
+                cache_control = response.headers.get('Cache-Control', '')
+                match = re.search(r'max-age=(\d+)', cache_control)
+                max_age = int(match.group(1)) if match else None
+                return json.loads(response.read()), max_age
+        with open(self.source) as source_file:
+            return json.load(source_file), None
+
+    '''
+    start()
+        start the background refresh thread (a daemon thread)
+    '''
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name='jwks-refresh', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            # if a fetch failed, keys are kept and it is tried again
+            # min_refetch_seconds later
+            time.sleep(max(
+                self.expires_at - self.refresh_before - time.monotonic(),
+                self.min_refetch_seconds))
+            self.fetch(self.attempts)
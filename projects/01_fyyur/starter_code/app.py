@@ -3,14 +3,26 @@
 #----------------------------------------------------------------------------#
 
 import json
+import csv
 import calendar
+import functools
+import itertools
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+import click
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for,jsonify,abort
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for,jsonify,abort,g,has_request_context,stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func,case
+from sqlalchemy import func,event,or_,and_,tuple_,DDL
+from sqlalchemy.engine import Engine
 from flask_migrate import Migrate
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
@@ -37,6 +49,13 @@ class Shows(db.Model):
     venue_id = db.Column(db.Integer,db.ForeignKey('Venue.id', ondelete='CASCADE'),nullable=False)
     artist_id = db.Column(db.Integer,db.ForeignKey('Artist.id', ondelete='CASCADE'),nullable=False)
     start_time = db.Column(db.DateTime,nullable=False)
+    #shows of a venue or an artist, in start time order, for detail pages,
+    #and all shows in start time order for shows list
+    __table_args__ = (
+      db.Index('ix_shows_venue_start_time','venue_id','start_time'),
+      db.Index('ix_shows_artist_start_time','artist_id','start_time'),
+      db.Index('ix_shows_start_time','start_time'),
+    )
 
     def __repr__(self):
       return f"<Show {self.id} >"
@@ -47,7 +66,11 @@ class AvailableTimes(db.Model):
     day_of_week = db.Column(db.Integer,nullable=False,default=0)
     start_time = db.Column(db.Time,nullable=False)
     end_time=db.Column(db.Time,nullable=False)
-    artist_id = db.Column(db.Integer,db.ForeignKey('Artist.id', ondelete='CASCADE'),nullable=False)
+    artist_id = db.Column(db.Integer,db.ForeignKey('Artist.id', ondelete='CASCADE'),nullable=False,index=True)
+    #available times of a day of week, for the availability interval trees (see Availability)
+    __table_args__ = (
+      db.Index('ix_AvailableTimes_day_of_week','day_of_week','start_time','end_time','artist_id'),
+    )
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
@@ -64,7 +87,18 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean,nullable=False,default=False)
     seeking_description = db.Column(db.String(500),nullable=True)
     genres = db.Column(db.String(500),nullable=False)
+    #number of upcoming and past shows, kept up to date when shows are created or deleted
+    #and moved from upcoming to past by "flask fyyur rollover"
+    upcoming_shows_count = db.Column(db.Integer,nullable=False,default=0,server_default='0')
+    past_shows_count = db.Column(db.Integer,nullable=False,default=0,server_default='0')
     shows = db.relationship('Shows',cascade="all,delete",backref='shows', passive_deletes=True,lazy=True)
+    #search by city,state, name search (ilike '%term%') using a trigram index on postgresql,
+    #and typeahead (lower(name) like 'term%') using the prefix index
+    __table_args__ = (
+      db.Index('ix_venue_city_state','city','state'),
+      db.Index('ix_venue_name_trgm','name',postgresql_using='gin',postgresql_ops={'name':'gin_trgm_ops'}),
+      db.Index('ix_venue_name_prefix',func.lower(name).label('lower_name'),postgresql_ops={'lower_name':'text_pattern_ops'}),
+    )
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
     def __repr__(self):
@@ -84,29 +118,511 @@ class Artist(db.Model):
     website = db.Column(db.String(200))
     seeking_venue = db.Column(db.Boolean,nullable=False,default=False)
     seeking_description = db.Column(db.String(500),nullable=True)
+    #number of upcoming and past shows, same as Venue
+    upcoming_shows_count = db.Column(db.Integer,nullable=False,default=0,server_default='0')
+    past_shows_count = db.Column(db.Integer,nullable=False,default=0,server_default='0')
     shows_list = db.relationship('Shows',cascade="all,delete",backref='shows_list', passive_deletes=True,lazy=True)
     available_times = db.relationship('AvailableTimes',cascade="all,delete",backref='time_list', passive_deletes=True,lazy=True)
+    #same indexes as Venue
+    __table_args__ = (
+      db.Index('ix_artist_city_state','city','state'),
+      db.Index('ix_artist_name_trgm','name',postgresql_using='gin',postgresql_ops={'name':'gin_trgm_ops'}),
+      db.Index('ix_artist_name_prefix',func.lower(name).label('lower_name'),postgresql_ops={'lower_name':'text_pattern_ops'}),
+    )
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
     def __repr__(self):
       return f'<Artist {self.id} : {self.name}>'
 
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120),nullable=False,unique=True)
+
+    def __repr__(self):
+      return f'<Genre {self.id} : {self.name}>'
+
+#genres of venues and artists, kept from their genres column (see Genres below),
+#the (genre_id, owner id) indexes list venues (or artists) of a genre
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id',db.Integer,db.ForeignKey('Venue.id', ondelete='CASCADE'),primary_key=True),
+    db.Column('genre_id',db.Integer,db.ForeignKey('Genre.id', ondelete='CASCADE'),primary_key=True),
+    db.Index('ix_venue_genres_genre_id','genre_id','venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id',db.Integer,db.ForeignKey('Artist.id', ondelete='CASCADE'),primary_key=True),
+    db.Column('genre_id',db.Integer,db.ForeignKey('Genre.id', ondelete='CASCADE'),primary_key=True),
+    db.Index('ix_artist_genres_genre_id','genre_id','artist_id'),
+)
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+#trigram indexes need the pg_trgm extension, for db.create_all() (migrations create it too)
+event.listen(Venue.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+#genres are the values of the Genres enum of forms.py
+GENRE_NAMES = [genre.value for genre in Genres]
+
+#Genre rows of the enum, for db.create_all() (migrations add them too)
+@event.listens_for(Genre.__table__, 'after_create')
+def insert_genres(table, connection, **kw):
+  connection.execute(table.insert(), [{'name': name} for name in GENRE_NAMES])
+
+#genre table of venues (or artists), and its venue (or artist) id column
+def genre_table(model):
+  if model is Venue:
+    return venue_genres, venue_genres.c.venue_id
+  return artist_genres, artist_genres.c.artist_id
+
+#rebuild genre rows of venues (or artists) of ids from their genres column,
+#or of all of them if ids is None, names that are not a Genre are only kept in the column
+def refresh_genres(connection, model, ids=None):
+  table, owner_column = genre_table(model)
+  delete = table.delete()
+  #genres column matches a genre if ',Jazz,Folk,' contains ',Jazz,'
+  matches = (',' + model.genres + ',').like('%,' + Genre.name + ',%')
+  select = db.select([model.id, Genre.id]).where(matches)
+  if ids is not None:
+    if not ids:
+      return
+    delete = delete.where(owner_column.in_(ids))
+    select = select.where(model.id.in_(ids))
+  connection.execute(delete)
+  connection.execute(table.insert().from_select([owner_column.name, 'genre_id'], select))
+  #equivalent sql : delete from venue_genres where venue_id in (ids);
+  #.................insert into venue_genres (venue_id,genre_id) select "Venue".id,"Genre".id from "Venue","Genre"
+  #.................where ','||"Venue".genres||',' like '%,'||"Genre".name||',%' and "Venue".id in (ids)
+
+@event.listens_for(Venue, 'after_insert')
+@event.listens_for(Artist, 'after_insert')
+def genres_inserted(mapper, connection, target):
+  refresh_genres(connection, type(target), [target.id])
+
+@event.listens_for(Venue, 'after_update')
+@event.listens_for(Artist, 'after_update')
+def genres_updated(mapper, connection, target):
+  if db.inspect(target).attrs.genres.history.has_changes():
+    refresh_genres(connection, type(target), [target.id])
+
+#id, name and number of upcoming shows of venues (or artists) of a genre, ordered by name,
+#joins the genre table using its (genre_id, owner id) index
+def genre_query(model, genre):
+  table, owner_column = genre_table(model)
+  #equivalent sql : select "Venue".id,"Venue".name,"Venue".upcoming_shows_count from "Venue"
+  #.................join venue_genres on venue_genres.venue_id = "Venue".id
+  #.................join "Genre" on "Genre".id = venue_genres.genre_id
+  #.................where "Genre".name = genre order by "Venue".name
+  return db.session.query(model.id, model.name, model.upcoming_shows_count.label('num_upcoming_shows'))\
+    .join(table, owner_column == model.id)\
+    .join(Genre, Genre.id == table.c.genre_id)\
+    .filter(Genre.name == genre)\
+    .order_by(model.name)
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+#add delta to upcoming or past shows counter of the show's venue and artist,
+#as an sql increment, so concurrent requests do not overwrite each other
+def change_show_counters(connection, venue_id, artist_id, start_time, delta):
+  column = 'upcoming_shows_count' if start_time >= datetime.now() else 'past_shows_count'
+  for model, model_id in ((Venue, venue_id), (Artist, artist_id)):
+    table = model.__table__
+    connection.execute(table.update()
+      .where(table.c.id == model_id)
+      .values({column: table.c[column] + delta}))
+  #equivalent sql : update "Venue" set upcoming_shows_count=upcoming_shows_count+1 where id=venue_id
+
+@event.listens_for(Shows, 'after_insert')
+def show_inserted(mapper, connection, show):
+  change_show_counters(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+@event.listens_for(Shows, 'after_delete')
+def show_deleted(mapper, connection, show):
+  change_show_counters(connection, show.venue_id, show.artist_id, show.start_time, -1)
+
+@event.listens_for(Shows, 'after_update')
+def show_updated(mapper, connection, show):
+  #venue, artist or start time may have changed, count old and new ones again
+  venue_ids = set([show.venue_id])
+  artist_ids = set([show.artist_id])
+  for ids, attribute in ((venue_ids, 'venue_id'), (artist_ids, 'artist_id')):
+    ids.update(value for value in db.inspect(show).attrs[attribute].history.deleted if value is not None)
+  refresh_show_counters(connection, Venue, Shows.venue_id, venue_ids)
+  refresh_show_counters(connection, Artist, Shows.artist_id, artist_ids)
+
+#shows of a deleted venue (or artist) are deleted by the database (ondelete cascade),
+#so show_deleted does not run for them, the artists (or venues) of these shows are
+#collected before the delete and counted again after it
+def show_counterparts(target):
+  if isinstance(target, Venue):
+    return Artist, Shows.artist_id, Shows.venue_id
+  return Venue, Shows.venue_id, Shows.artist_id
+
+@event.listens_for(Venue, 'before_delete')
+@event.listens_for(Artist, 'before_delete')
+def show_owner_deleting(mapper, connection, target):
+  model, show_column, owner_column = show_counterparts(target)
+  target._show_counterpart_ids = set(row[0] for row in connection.execute(
+    db.select([show_column]).where(owner_column == target.id).distinct()))
+  #equivalent sql : select distinct artist_id from "Shows" where venue_id=venue_id
+
+@event.listens_for(Venue, 'after_delete')
+@event.listens_for(Artist, 'after_delete')
+def show_owner_deleted(mapper, connection, target):
+  model, show_column, owner_column = show_counterparts(target)
+  refresh_show_counters(connection, model, show_column, target.__dict__.pop('_show_counterpart_ids', set()))
+
+#count upcoming and past shows again for venues (or artists) of ids,
+#or for all of them if ids is None
+def refresh_show_counters(connection, model, show_column, ids=None):
+  now = datetime.now()
+  table = model.__table__
+  def count(condition):
+    return db.select([func.count(Shows.id)])\
+      .where(show_column == table.c.id).where(condition).as_scalar()
+  update = table.update().values(
+    upcoming_shows_count=count(Shows.start_time >= now),
+    past_shows_count=count(Shows.start_time < now))
+  if ids is not None:
+    if not ids:
+      return
+    update = update.where(table.c.id.in_(ids))
+  connection.execute(update)
+  #equivalent sql : update "Venue" set upcoming_shows_count=(select count(id) from "Shows" where venue_id="Venue".id and start_time>=now()),
+  #.................past_shows_count=(select count(id) from "Shows" where venue_id="Venue".id and start_time<now()) where id in (ids)
+
+#move shows that started since the last run from upcoming to past counters,
+#counts of venues and artists having shows started in the last `since` are refreshed
+def roll_over_show_counters(since):
+  now = datetime.now()
+  started = db.session.query(Shows.venue_id,Shows.artist_id)\
+    .filter(Shows.start_time >= now - since, Shows.start_time < now).all()
+  venue_ids = set(show.venue_id for show in started)
+  artist_ids = set(show.artist_id for show in started)
+  connection = db.session.connection()
+  refresh_show_counters(connection, Venue, Shows.venue_id, venue_ids)
+  refresh_show_counters(connection, Artist, Shows.artist_id, artist_ids)
+  db.session.commit()
+  return len(venue_ids), len(artist_ids)
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+#babel patterns of named formats, any other format is a babel pattern itself
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+#compiled babel pattern and locale of a format, parsed once per format and locale
+@functools.lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+#value is a datetime from the database, strings are still parsed for older callers
+def format_datetime(value, format='medium', locale=None):
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  pattern, locale = datetime_pattern(format, str(locale or babel.dates.LC_TIME))
+  return pattern.apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Caches.
+#----------------------------------------------------------------------------#
+
+class TimedCache(object):
+  '''
+  values kept for a number of seconds, or until cleared,
+  the least recently used values are dropped over max_size
+  '''
+  def __init__(self, seconds, max_size=1000):
+    self.seconds = seconds
+    self.max_size = max_size
+    self.lock = threading.Lock()
+    self.values = OrderedDict()
+
+  #get value of key, load() is called to get it if missing or expired
+  def get(self, key, load):
+    now = time.monotonic()
+    with self.lock:
+      cached = self.values.get(key)
+      if cached is not None and cached[0] > now:
+        self.values.move_to_end(key)
+        return cached[1]
+    value = load()
+    with self.lock:
+      self.values[key] = (now + self.seconds, value)
+      self.values.move_to_end(key)
+      while len(self.values) > self.max_size:
+        self.values.popitem(last=False)
+    return value
+
+  def clear(self):
+    with self.lock:
+      self.values.clear()
+
+#venues listing grouped by city and state, num_upcoming_shows changes as time
+#passes so values expire after VENUES_CACHE_SECONDS, or when venues or shows change
+venues_cache = TimedCache(app.config.get('VENUES_CACHE_SECONDS', 60))
+
+@event.listens_for(Venue, 'after_insert')
+@event.listens_for(Venue, 'after_update')
+@event.listens_for(Venue, 'after_delete')
+@event.listens_for(Artist, 'after_delete')
+@event.listens_for(Shows, 'after_insert')
+@event.listens_for(Shows, 'after_update')
+@event.listens_for(Shows, 'after_delete')
+def clear_venues_cache(mapper, connection, target):
+  venues_cache.clear()
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+#typeahead results by normalized term, kept TYPEAHEAD_CACHE_SECONDS,
+#or until venues or artists change
+typeahead_cache = TimedCache(app.config.get('TYPEAHEAD_CACHE_SECONDS', 30), max_size=10000)
+
+@event.listens_for(Venue, 'after_insert')
+@event.listens_for(Venue, 'after_update')
+@event.listens_for(Venue, 'after_delete')
+@event.listens_for(Artist, 'after_insert')
+@event.listens_for(Artist, 'after_update')
+@event.listens_for(Artist, 'after_delete')
+def clear_typeahead_cache(mapper, connection, target):
+  typeahead_cache.clear()
+
+#lower case and single spaces, e.g "  The  Musical " -> "the musical"
+def normalize_term(term):
+  return ' '.join((term or '').lower().split())
+
+#escape like wildcards (% and _) of a search term
+def like_escape(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+#venues (or artists) id, name and number of upcoming shows, with a name containing term,
+#ordered by name, ilike '%term%' uses the name trigram index on postgresql
+def name_search_query(model, term):
+  return model.query.with_entities(model.id, model.name, model.upcoming_shows_count.label('num_upcoming_shows'))\
+    .filter(model.name.ilike('%' + like_escape(term.strip()) + '%', escape='\\'))\
+    .order_by(model.name, model.id)
+
+#one page of a query results, with the number of all results counted by the same statement
+#(count(*) over ()), one more row is fetched to know if there is a next page
+def search_page(query, page, per_page=None):
+  per_page = per_page or app.config.get('SEARCH_RESULTS_PER_PAGE', 20)
+  page = max(page, 1)
+  rows = query.add_columns(func.count().over().label('total'))\
+    .limit(per_page + 1).offset((page - 1) * per_page).all()
+  #equivalent sql : select id,name,upcoming_shows_count,count(*) over () as total from ... limit per_page+1 offset (page-1)*per_page
+  if rows:
+    count = rows[0].total
+  else:
+    #past the last page, results are counted by another query
+    count = query.order_by(None).count() if page > 1 else 0
+  data = rows[:per_page]
+  return {
+    'count': count,
+    'data': data,
+    'shown': len(data),
+    'page': page,
+    'first': (page - 1) * per_page + 1,
+    'has_next': len(rows) > per_page,
+  }
+
+#id and name of venues (or artists) with a name starting with term, for typeahead,
+#lower(name) like 'term%' uses the name prefix index, which is already in name order
+def typeahead(model, term):
+  term = normalize_term(term)
+  if not term:
+    return []
+  def load():
+    rows = model.query.with_entities(model.id, model.name)\
+      .filter(func.lower(model.name).like(like_escape(term) + '%', escape='\\'))\
+      .order_by(func.lower(model.name))\
+      .limit(app.config.get('TYPEAHEAD_LIMIT', 10))\
+      .all()
+    #equivalent sql : select id,name from "Venue" where lower(name) like 'term%' order by lower(name) limit 10
+    return [{'id': row.id, 'name': row.name} for row in rows]
+  return typeahead_cache.get((model.__name__, term), load)
+
+#----------------------------------------------------------------------------#
+# Availability.
+#----------------------------------------------------------------------------#
+
+class IntervalTree(object):
+  '''
+  static centered interval tree of (start, end, value) intervals, built once,
+  covering(start, end) returns values of intervals containing both start and end
+  '''
+  def __init__(self, intervals):
+    self.size = len(intervals)
+    self.root = self.build(intervals)
+
+  #node is (center, intervals containing center by start, same by end descending, left, right),
+  #left and right are nodes of intervals ending before and starting after center
+  def build(self, intervals):
+    if not intervals:
+      return None
+    points = sorted(point for interval in intervals for point in interval[:2])
+    center = points[len(points) // 2]
+    left, right, here = [], [], []
+    for interval in intervals:
+      if interval[1] < center:
+        left.append(interval)
+      elif interval[0] > center:
+        right.append(interval)
+      else:
+        here.append(interval)
+    return (center,
+      sorted(here, key=lambda interval: interval[0]),
+      sorted(here, key=lambda interval: interval[1], reverse=True),
+      self.build(left),
+      self.build(right))
+
+  def covering(self, start, end):
+    values = []
+    node = self.root
+    while node is not None:
+      center, by_start, by_end, left, right = node
+      if start < center:
+        #all of them end after start, the first ones start before it
+        for interval in by_start:
+          if interval[0] > start:
+            break
+          if interval[1] >= end:
+            values.append(interval[2])
+        node = left
+      else:
+        #all of them start before start, the first ones end after it
+        for interval in by_end:
+          if interval[1] < end:
+            break
+          values.append(interval[2])
+        node = right if start > center else None
+    return values
+
+#artists available times of a day of week (0 is monday) as an interval tree of artist ids,
+#kept AVAILABILITY_CACHE_SECONDS or until available times change
+availability_cache = TimedCache(app.config.get('AVAILABILITY_CACHE_SECONDS', 300), max_size=7)
+
+@event.listens_for(AvailableTimes, 'after_insert')
+@event.listens_for(AvailableTimes, 'after_update')
+@event.listens_for(AvailableTimes, 'after_delete')
+def clear_availability_cache(mapper, connection, target):
+  availability_cache.clear()
+
+def availability_tree(day_of_week):
+  def load():
+    rows = db.session.query(AvailableTimes.start_time, AvailableTimes.end_time, AvailableTimes.artist_id)\
+      .filter(AvailableTimes.day_of_week == day_of_week).all()
+    #equivalent sql : select start_time,end_time,artist_id from "AvailableTimes" where day_of_week = day_of_week
+    return IntervalTree([tuple(row) for row in rows])
+  return availability_cache.get(day_of_week, load)
+
+#start and end of a show starting at start_time, SHOW_SLOT_MINUTES long
+def show_slot(start_time):
+  return start_time, start_time + timedelta(minutes=app.config.get('SHOW_SLOT_MINUTES', 120))
+
+#available times are entered to the minute, one ending at 23:59 lasts until midnight
+END_OF_DAY = datetime.min.time().replace(hour=23, minute=59)
+
+#(day of week, start, end time of day) parts of a slot, one for each day it covers,
+#a slot crossing midnight has a part ending at END_OF_DAY and a part starting at midnight
+#of the next day, checked against the available times of that day of week
+def slot_parts(start, end):
+  parts = []
+  day = start
+  while day.date() < end.date():
+    parts.append((day.weekday(), day.time(), END_OF_DAY))
+    day = datetime.combine(day.date() + timedelta(days=1), datetime.min.time())
+  if end > day:
+    parts.append((day.weekday(), day.time(), end.time()))
+  return parts
+
+#id and name of artists of a city (and state) free for a show starting at start_time:
+#one of their available times contains the show slot (artists without available times
+#can be booked at any time, as in show_conflicts), and they have no show during it
+def free_artists(start_time, city, state=None):
+  start, end = show_slot(start_time)
+  available = None
+  for day_of_week, part_start, part_end in slot_parts(start, end):
+    covering = set(availability_tree(day_of_week).covering(part_start, part_end))
+    available = covering if available is None else available & covering
+  has_times = db.exists().where(AvailableTimes.artist_id == Artist.id)
+  query = db.session.query(Artist.id, Artist.name, has_times.label('has_times')).filter(Artist.city == city)
+  if state:
+    query = query.filter(Artist.state == state)
+  artists = [artist for artist in query.order_by(Artist.name) if artist.id in available or not artist.has_times]
+  if not artists:
+    return []
+  #shows of these artists overlapping the slot, using the Shows (artist_id, start_time) index
+  busy = set(artist_id for artist_id, in db.session.query(Shows.artist_id)
+    .filter(Shows.artist_id.in_([artist.id for artist in artists]))
+    .filter(Shows.start_time > start - (end - start), Shows.start_time < end))
+  #equivalent sql : select id,name,exists(select * from "AvailableTimes" where artist_id = "Artist".id) as has_times
+  #.................from "Artist" where city = city and state = state order by name;
+  #.................select artist_id from "Shows" where artist_id in (ids) and start_time > start - slot and start_time < end
+  return [{'id': artist.id, 'name': artist.name} for artist in artists if artist.id not in busy]
+
+#reasons a show of artist at venue starting at start_time can not be booked, empty if it can:
+#the slot is not in the artist's available times (if the artist has some),
+#or the venue or the artist has another show during it
+def show_conflicts(venue_id, artist_id, start_time):
+  start, end = show_slot(start_time)
+  times = AvailableTimes.query.filter(AvailableTimes.artist_id == artist_id).all()
+  #shows starting less than a slot before or during the slot,
+  #using the Shows (venue_id, start_time) and (artist_id, start_time) indexes
+  shows = db.session.query(Shows.venue_id, Shows.artist_id, Shows.start_time)\
+    .filter(or_(Shows.venue_id == venue_id, Shows.artist_id == artist_id))\
+    .filter(Shows.start_time > start - (end - start), Shows.start_time < end).all()
+  #equivalent sql : select venue_id,artist_id,start_time from "Shows" where (venue_id = venue_id or artist_id = artist_id)
+  #.................and start_time > start - slot and start_time < end
+  return slot_conflicts(venue_id, artist_id, start, end, times, shows)
+
+#conflicts of a show slot (see show_conflicts) with available times of its artist,
+#and shows (having venue_id, artist_id and start_time) of its venue or artist
+def slot_conflicts(venue_id, artist_id, start, end, times, shows):
+  conflicts = []
+  if times and not all(any(t.day_of_week == day_of_week and t.start_time <= part_start and t.end_time >= part_end for t in times)
+      for day_of_week, part_start, part_end in slot_parts(start, end)):
+    conflicts.append('Artist is not available at this time')
+  shows = [show for show in shows if start - (end - start) < show.start_time < end]
+  if any(show.venue_id == venue_id for show in shows):
+    conflicts.append('Venue already has a show at this time')
+  if any(show.artist_id == artist_id for show in shows):
+    conflicts.append('Artist already has a show at this time')
+  return conflicts
+
+#----------------------------------------------------------------------------#
+# Query budget.
+#----------------------------------------------------------------------------#
+
+#count SQL statements run by each request
+@event.listens_for(Engine, 'after_cursor_execute')
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+  if has_request_context():
+    g.statements = g.get('statements', 0) + 1
+
+#QUERY_BUDGET of config is the number of SQL statements each route (endpoint name)
+#should run at most, a warning is logged for requests running more
+@app.after_request
+def check_query_budget(response):
+  budget = app.config.get('QUERY_BUDGET', {}).get(request.endpoint)
+  statements = g.get('statements', 0)
+  if budget is not None and statements > budget:
+    app.logger.warning('%s ran %d SQL statements, query budget is %d', request.endpoint, statements, budget)
+  return response
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -128,31 +644,8 @@ def index():
 def venues():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
-  # select distinct city,state from venues to have categorized upon them
-  cities_states = [(v.city,v.state) for v in db.session.query(Venue.city,Venue.state).distinct()]
-  #equivalent sql query : select distinct city,state from "Venue";
-  data = []
-  #loop through city,state and retrieve venues in this city,state
-  for city_state in cities_states:
-    city = city_state[0]
-    state = city_state[1]
-    #query venues filtering venue.city=city and venue.state = state
-    #also joining shows to count number of upcoming shows -> where show start time is larger than now
-    venues = db.session.query(Venue.id,Venue.name,func.count(case([(Shows.start_time>func.now(),1)])).label('num_upcoming_shows'))\
-      .outerjoin(Shows,Shows.venue_id==Venue.id)\
-      .group_by(Venue.id)\
-      .filter(Venue.city==city,Venue.state==state)\
-      .all()
-    #equivalent sql query : select "Venue".id,"Venue".name,COALESCE(count("Shows".id),0)  
-    # ......................from "Venue" left join "Shows" on "Venue".id = "Shows".venue_id group by "Venue".id
-    #.......................where "Venue".city=city and "Venue".state=state
-
-    #create item with city,state, and venues in this city,state then append to response
-    item={}
-    item['city'] = city
-    item['state']=state
-    item['venues']=venues
-    data.append(item)
+  #venues grouped by city,state are cached, query budget is 1 statement (0 when cached)
+  data = venues_cache.get('areas', load_venues_areas)
   # data=[{
   #   "city": "San Francisco",
   #   "state": "CA",
@@ -176,7 +669,27 @@ def venues():
   # }]
   return render_template('pages/venues.html', areas=data)
 
-@app.route('/venues/search', methods=['POST'])
+def load_venues_areas():
+  #query all venues with their number of upcoming shows at once, ordered by city,state
+  #so the same city,state venues are next to each other
+  #number of upcoming shows is read from the venue's counter, shows are not aggregated
+  venues = db.session.query(Venue.city,Venue.state,Venue.id,Venue.name,Venue.upcoming_shows_count.label('num_upcoming_shows'))\
+    .order_by(Venue.state,Venue.city,Venue.id)\
+    .all()
+  #equivalent sql query : select city,state,id,name,upcoming_shows_count as num_upcoming_shows
+  # ......................from "Venue" order by state,city,id
+
+  #create item with city,state, and venues in this city,state for each city,state
+  data = []
+  for (city,state),rows in itertools.groupby(venues,key=lambda v: (v.city,v.state)):
+    item={}
+    item['city'] = city
+    item['state']=state
+    item['venues']=[{'id':v.id,'name':v.name,'num_upcoming_shows':v.num_upcoming_shows} for v in rows]
+    data.append(item)
+  return data
+
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
@@ -189,14 +702,80 @@ def search_venues():
   #     "num_upcoming_shows": 0,
   #   }]
   # }
-  response={}
-  #query venues filtering name ilike search term, ilike for case insensitive
-  venuesList = Venue.query.filter(Venue.name.ilike('%'+request.form.get('search_term')+'%'))
-  #equivalent sql query : select "Venue".id,"Venue".name from "Venue" where LOWER(name) like LOWER('%search_term%')
-  #get count and data from query
-  response['count']=venuesList.count()
-  response['data']=venuesList.all()
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.values.get('search_term', '')
+  #query venues filtering name ilike search term, ilike for case insensitive, one page only
+  response = search_page(name_search_query(Venue, search_term), request.args.get('page', 1, type=int))
+  #equivalent sql query : select "Venue".id,"Venue".name from "Venue" where name ilike '%search_term%' order by name limit 21 offset 0
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@app.route('/venues/typeahead')
+def typeahead_venues():
+  #names of venues starting with ?q=, for the search box suggestions
+  return jsonify({'data': typeahead(Venue, request.args.get('q', ''))})
+
+class ShowsList(list):
+  '''shows of a detail page, total is the number of all shows, even if not all are listed'''
+  total = 0
+
+#shows listed on a detail page in each of past and upcoming shows,
+#from ?shows= or DETAIL_SHOWS_LIMIT of config, 0 or less for all shows
+def detail_shows_limit():
+  limit = request.args.get('shows', app.config.get('DETAIL_SHOWS_LIMIT'), type=int)
+  return limit if limit and limit > 0 else None
+
+#query of a venue (or artist) with its shows, see load_detail_page
+def detail_page_query(model, model_id, limit=None):
+  if model is Venue:
+    show_column, other, prefix = Shows.venue_id, Artist, 'artist'
+  else:
+    show_column, other, prefix = Shows.artist_id, Venue, 'venue'
+  upcoming = Shows.start_time >= datetime.now()
+  #shows joining the other side (artists of a venue, or venues of an artist),
+  #numbered by start time and counted in each of past and upcoming shows
+  shows = db.session.query(
+      show_column.label('owner_id'),
+      Shows.start_time.label('start_time'),
+      other.id.label(prefix+'_id'),
+      other.name.label(prefix+'_name'),
+      other.image_link.label(prefix+'_image_link'),
+      upcoming.label('upcoming'),
+      func.row_number().over(partition_by=upcoming, order_by=(Shows.start_time, Shows.id)).label('number'),
+      func.count(Shows.id).over(partition_by=upcoming).label('total'))\
+    .join(other).filter(show_column==model_id).subquery()
+  query = db.session.query(model, shows)\
+    .outerjoin(shows, shows.c.owner_id==model.id)\
+    .filter(model.id==model_id)
+  if limit:
+    #first upcoming shows and last past shows only
+    query = query.filter(or_(shows.c.number==None,
+      and_(shows.c.upcoming==True, shows.c.number<=limit),
+      and_(shows.c.upcoming==False, shows.c.number>shows.c.total-limit)))
+  #equivalent sql query : select "Venue".*,shows.* from "Venue" left join (select "Shows".venue_id,"Shows".start_time,"Artist".id,"Artist".name,"Artist".image_link,
+  #.......................start_time>=now() as upcoming,row_number() over (partition by start_time>=now() order by start_time) as number,
+  #.......................count("Shows".id) over (partition by start_time>=now()) as total
+  #.......................from "Shows" join "Artist" on "Artist".id="Shows".artist_id where "Shows".venue_id=venue_id) shows on shows.venue_id="Venue".id
+  #.......................where "Venue".id=venue_id order by number
+  return query.order_by(shows.c.number), prefix
+
+#load a venue (or artist) with its shows in one query,
+#returns (venue or None, past shows, upcoming shows),
+#upcoming shows are soonest first, past shows latest first, at most limit of each
+def load_detail_page(model, model_id, limit=None):
+  query, prefix = detail_page_query(model, model_id, limit)
+  rows = query.all()
+  if not rows:
+    return None, ShowsList(), ShowsList()
+  #split shows into past and upcoming in python
+  past_shows, upcoming_shows = ShowsList(), ShowsList()
+  keys = ('start_time', prefix+'_id', prefix+'_name', prefix+'_image_link')
+  for row in rows:
+    if row.number is None:
+      continue
+    shows_list = upcoming_shows if row.upcoming else past_shows
+    shows_list.append({key: getattr(row, key) for key in keys})
+    shows_list.total = row.total
+  past_shows.reverse()
+  return rows[0][0], past_shows, upcoming_shows
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
@@ -280,9 +859,10 @@ def show_venue(venue_id):
   #   "upcoming_shows_count": 1,    
   # }
 
-  #get venue by id and add attributes to response data
-  venue = Venue.query.get(venue_id)
-  #equivalent sql query : select * from "Venue" where id=venue_id
+  #get venue and its shows (with their artists) in one query, 404 if venue does not exist
+  venue, past_shows, upcoming_shows = load_detail_page(Venue, venue_id, detail_shows_limit())
+  if venue is None:
+    abort(404)
   data={}
   data['id']=venue.id
   data['name']=venue.name
@@ -296,24 +876,10 @@ def show_venue(venue_id):
   data['facebook_link']=venue.facebook_link
   data['seeking_talent']=venue.seeking_talent
   data['seeking_description']=venue.seeking_description
-
-  #query past show
-  #query shows joining artists filtering the show start time is before now
-  #creating labels for each column in query to match response format
-  #equivalent sql query : select "Shows".start_time, "Artist".id,"Artist".name,"Artist".image_link as artist_image_link from "Shows" LEFT JOIN "Artist" on "Shows".artist_id = "Artist".id where "Shows".start_time<now()
-  past_shows = db.session.query(func.to_char(Shows.start_time,"DD Mon YYYY HH:MM:SS").label('start_time'),Artist.id.label('artist_id'),Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'))\
-    .outerjoin(Artist).filter(Shows.venue_id==venue_id,Shows.start_time<func.now())
-  data['past_shows']=past_shows.all()
-  data['past_shows_count']=past_shows.count()
-
-  #query upcoming show
-  #query shows joining artists filtering the show start time is after or equal now
-  #creating labels for each column in query to match response format
-  #equivalent sql query : select "Shows".start_time, "Artist".id,"Artist".name,"Artist".image_link as artist_image_link from "Shows" LEFT JOIN "Artist" on "Shows".artist_id = "Artist".id where "Shows".start_time>=now()
-  upcoming_shows = db.session.query(func.to_char(Shows.start_time,"DD Mon YYYY HH:MM:SS").label('start_time'),Artist.id.label('artist_id'),Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'))\
-    .outerjoin(Artist).filter(Shows.venue_id==venue_id,Shows.start_time>=func.now())
-  data['upcoming_shows']=upcoming_shows.all()
-  data['upcoming_shows_count']=upcoming_shows.count()
+  data['past_shows']=past_shows
+  data['past_shows_count']=past_shows.total
+  data['upcoming_shows']=upcoming_shows
+  data['upcoming_shows_count']=upcoming_shows.total
 
   #data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
   return render_template('pages/show_venue.html', venue=data)
@@ -446,7 +1012,7 @@ def delete_artist(artist_id):
   #return json response with delete status
   return jsonify({'deleted':success})
   
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
@@ -460,14 +1026,52 @@ def search_artists():
   #   }]
   # }
 
-  #query artists filtering name that like search_term case insensitive
-  query = Artist.query.filter(Artist.name.ilike('%'+request.form.get('search_term', '')+'%'))
-  #equivalent sql : select id,name from "Artist" where LOWER("Artist".name) like LOWER('%search_term%')
-  response={
-    "count": query.count(),
-    "data": query.all()
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.values.get('search_term', '')
+  #query artists filtering name that like search_term case insensitive, one page only
+  response = search_page(name_search_query(Artist, search_term), request.args.get('page', 1, type=int))
+  #equivalent sql : select id,name from "Artist" where name ilike '%search_term%' order by name limit 21 offset 0
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@app.route('/artists/typeahead')
+def typeahead_artists():
+  #names of artists starting with ?q=, for the search box suggestions
+  return jsonify({'data': typeahead(Artist, request.args.get('q', ''))})
+
+#  Genres
+#  ----------------------------------------------------------------
+
+@app.route('/genres')
+def genres():
+  #genres are fixed, no query
+  return render_template('pages/genres.html', genres=GENRE_NAMES)
+
+@app.route('/genres/<genre>/venues')
+def genre_venues(genre):
+  if genre not in GENRE_NAMES:
+    abort(404)
+  #venues of the genre, one page only
+  response = search_page(genre_query(Venue, genre), request.args.get('page', 1, type=int))
+  return render_template('pages/genre.html', results=response, genre=genre, kind='venues')
+
+@app.route('/genres/<genre>/artists')
+def genre_artists(genre):
+  if genre not in GENRE_NAMES:
+    abort(404)
+  #artists of the genre, one page only
+  response = search_page(genre_query(Artist, genre), request.args.get('page', 1, type=int))
+  return render_template('pages/genre.html', results=response, genre=genre, kind='artists')
+
+@app.route('/artists/available')
+def available_artists():
+  #artists of ?city= (and ?state=) free for a show starting at ?start_time=, e.g 2035-04-01T20:00
+  try:
+    start_time = datetime.strptime(request.args.get('start_time', ''), '%Y-%m-%dT%H:%M')
+  except ValueError:
+    abort(400)
+  city = request.args.get('city')
+  if not city:
+    abort(400)
+  return jsonify({'data': free_artists(start_time, city, request.args.get('state'))})
 
 @app.route('/artists/placesearch', methods=['POST'])
 def search_place_artists():
@@ -609,9 +1213,10 @@ def show_artist(artist_id):
   #   "upcoming_shows_count": 3,
   # }
 
-  #get artist by id and add attributes to data
-  #equivalent sql = select * from "Artist" where "Artist".id = artist_id
-  artist = Artist.query.get(artist_id)
+  #get artist and its shows (with their venues) in one query, 404 if artist does not exist
+  artist, past_shows, upcoming_shows = load_detail_page(Artist, artist_id, detail_shows_limit())
+  if artist is None:
+    abort(404)
   data={}
   data['id']=artist.id
   data['name']=artist.name
@@ -623,22 +1228,10 @@ def show_artist(artist_id):
   data['seeking_description']=artist.seeking_description
   data['image_link']=artist.image_link
   data['available_times']=artist.available_times
-
-  #query artist's past shows by quering shows filtering start_time is before now
-  #creating labels for columns to match response format
-  #equivalent sql query : select "Shows".start_time, "Venue".id,"Venue".name,"Venue".image_link as venue_image_link from "Shows" LEFT JOIN "Venue" on "Shows".venue_id = "Venue".id where "Shows".start_time<now()
-  past_shows = db.session.query(func.to_char(Shows.start_time,"DD Mon YYYY HH:MM:SS").label('start_time'),Venue.id.label('venue_id'),Venue.name.label('venue_name'),Venue.image_link.label('venue_image_link'))\
-    .outerjoin(Venue).filter(Shows.artist_id==artist_id,Shows.start_time<func.now())
-  data['past_shows']=past_shows.all()
-  data['past_shows_count']=past_shows.count()
-
-  #query artist's upcoming shows by quering shows filtering start_time is after now
-  #creating labels for columns to match response format
-  #equivalent sql query : select "Shows".start_time, "Venue".id,"Venue".name,"Venue".image_link as venue_image_link from "Shows" LEFT JOIN "Venue" on "Shows".venue_id = "Venue".id where "Shows".start_time>=now()
-  upcoming_shows = db.session.query(func.to_char(Shows.start_time,"DD Mon YYYY HH:MM:SS").label('start_time'),Venue.id.label('venue_id'),Venue.name.label('venue_name'),Venue.image_link.label('venue_image_link'))\
-    .outerjoin(Venue).filter(Shows.artist_id==artist_id,Shows.start_time>=func.now())
-  data['upcoming_shows']=upcoming_shows.all()
-  data['upcoming_shows_count']=upcoming_shows.count()
+  data['past_shows']=past_shows
+  data['past_shows_count']=past_shows.total
+  data['upcoming_shows']=upcoming_shows
+  data['upcoming_shows_count']=upcoming_shows.total
 
   days_names = calendar.day_name
   # data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
@@ -896,16 +1489,31 @@ def shows():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-  #get a list of all shows, querying Shows joining Venue and Artist to get their id and name
-  #creating labels for each column to match response format
-  showsList = db.session.query(func.to_char(Shows.start_time,"DD Mon YYYY HH:MM:SS").label('start_time'),Venue.id.label('venue_id'),Venue.name.label('venue_name'),Artist.id.label('artist_id'),Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'))\
-    .outerjoin(Venue)\
-    .outerjoin(Artist)\
-    .all()
-  #equivalent sql : SELECT "Artist".id,"Artist".name,"Venue".id,"Venue".name,"Shows".start_time 
-  #.................FROM "Shows",
-  #.................LEFT JOIN "Artist" on "Shows".artist_id = "Artist".id
-  #.................LEFT JOIN "Venue" on "Shows".venue_id = "Venue".id
+  #filters from query string, upcoming shows by default
+  filters = {
+    'when': request.args.get('when', 'upcoming'),
+    'start_date': request.args.get('start_date', ''),
+    'end_date': request.args.get('end_date', ''),
+  }
+  #malformed filters or cursor are a bad request, as in the other list routes
+  if filters['when'] not in ('upcoming', 'past', 'all'):
+    abort(400)
+  try:
+    start_date = datetime.strptime(filters['start_date'], '%Y-%m-%d') if filters['start_date'] else None
+    end_date = datetime.strptime(filters['end_date'], '%Y-%m-%d') if filters['end_date'] else None
+    after = parse_show_cursor(request.args.get('after'))
+    limit = int(request.args.get('limit', app.config.get('SHOWS_PER_PAGE', 60)))
+  except ValueError:
+    abort(400)
+  limit = max(1, min(limit, app.config.get('SHOWS_MAX_PER_PAGE', 5000)))
+  stream = request.args.get('stream', '1' if app.config.get('SHOWS_STREAM') else '0') == '1'
+
+  #get one page of shows, one more is fetched to know if there is a next page
+  query = shows_query(filters['when'], start_date, end_date, after).limit(limit + 1)
+
+  def page_url(cursor):
+    args = {name: value for name, value in filters.items() if value}
+    return url_for('shows', after=cursor, limit=request.args.get('limit'), stream=request.args.get('stream'), **args)
   
   # data=[{
   #   "venue_id": 1,
@@ -943,7 +1551,88 @@ def shows():
   #   "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
   #   "start_time": "2035-04-15T20:00:00.000Z"
   # }]
-  return render_template('pages/shows.html', shows=showsList)
+  if stream:
+    #rows are read from a server-side cursor while the page is sent,
+    #so a long page does not need all shows in memory at once
+    rows = query.execution_options(stream_results=True).yield_per(200)
+    return Response(stream_with_context(stream_template('pages/shows.html', shows=ShowsPage(rows, limit), filters=filters, page_url=page_url)))
+  return render_template('pages/shows.html', shows=ShowsPage(query.all(), limit), filters=filters, page_url=page_url)
+
+#query of shows with their venue and artist, in page order, see shows()
+def shows_query(when, start_date=None, end_date=None, after=None):
+  #querying Shows joining Venue and Artist to get their id and name
+  #creating labels for each column to match response format
+  query = db.session.query(Shows.id,Shows.start_time,Venue.id.label('venue_id'),Venue.name.label('venue_name'),Artist.id.label('artist_id'),Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'))\
+    .join(Venue)\
+    .join(Artist)
+  now = datetime.now()
+  if when == 'upcoming':
+    query = query.filter(Shows.start_time >= now)
+  elif when == 'past':
+    query = query.filter(Shows.start_time < now)
+  if start_date:
+    query = query.filter(Shows.start_time >= start_date)
+  if end_date:
+    #end date is included
+    query = query.filter(Shows.start_time < end_date + timedelta(days=1))
+  #past shows latest first, others soonest first,
+  #next pages continue after (start_time, id) of the last show of previous page (keyset paging)
+  key = tuple_(Shows.start_time, Shows.id)
+  if when == 'past':
+    if after:
+      query = query.filter(key < tuple_(*after))
+    query = query.order_by(Shows.start_time.desc(), Shows.id.desc())
+  else:
+    if after:
+      query = query.filter(key > tuple_(*after))
+    query = query.order_by(Shows.start_time, Shows.id)
+  #equivalent sql : SELECT "Shows".id,"Shows".start_time,"Artist".id,"Artist".name,"Venue".id,"Venue".name
+  #.................FROM "Shows"
+  #.................JOIN "Venue" on "Shows".venue_id = "Venue".id
+  #.................JOIN "Artist" on "Shows".artist_id = "Artist".id
+  #.................WHERE "Shows".start_time >= now() AND ("Shows".start_time, "Shows".id) > (after_start_time, after_id)
+  #.................ORDER BY "Shows".start_time, "Shows".id LIMIT limit+1
+  return query
+
+class ShowsPage(object):
+  '''
+  one page of shows, rows are read while the template iterates over them,
+  next_cursor is set once iterated if there are more shows
+  '''
+  def __init__(self, rows, limit):
+    self.rows = rows
+    self.limit = limit
+    self.count = 0
+    self.next_cursor = None
+
+  def __iter__(self):
+    last = None
+    for row in self.rows:
+      if self.count == self.limit:
+        self.next_cursor = show_cursor(last)
+        break
+      self.count += 1
+      last = row
+      yield row
+
+#keyset paging cursor of a show, e.g "2035-04-01T20:00:00_17"
+def show_cursor(show):
+  return '{}_{}'.format(show.start_time.isoformat(), show.id)
+
+#(start_time, id) of a cursor, raises ValueError if not valid
+def parse_show_cursor(cursor):
+  if not cursor:
+    return None
+  start_time, _, show_id = cursor.rpartition('_')
+  return datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S' if '.' not in start_time else '%Y-%m-%dT%H:%M:%S.%f'), int(show_id)
+
+#render a template while iterating, sent to the client a few parts at a time
+def stream_template(template_name, **context):
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(5)
+  return stream
 
 @app.route('/shows/create')
 def create_shows():
@@ -969,8 +1658,18 @@ def create_show_submission():
   if(artist is None):
     flash('Artist id is not correct','danger')
   
-  #must have both artist's id and venue's id correct to continue
+  #start time must be valid, and the show must not conflict with the artist's available times or other shows
+  conflicts = []
   if(artist and venue):
+    if(postedForm.start_time.data is None):
+      conflicts = ['Start time is not correct']
+    else:
+      conflicts = show_conflicts(venue.id, artist.id, postedForm.start_time.data)
+    for conflict in conflicts:
+      flash(conflict,'danger')
+
+  #must have both artist's id and venue's id correct, and no conflicts, to continue
+  if(artist and venue and not conflicts):
     #create a show from posted data
     show = Shows(
       venue_id = postedForm.venue_id.data,
@@ -1004,6 +1703,417 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   # return render_template('pages/home.html')
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+@fyyur_cli.command('rollover')
+@click.option('--hours', default=25, help='Refresh counts of shows started in the last hours, at least the time between two runs.')
+@click.option('--all', 'refresh_all', is_flag=True, help='Count upcoming and past shows of all venues and artists again.')
+def rollover_command(hours, refresh_all):
+  '''Move shows that started from upcoming to past counters, run it from cron, e.g hourly.'''
+  if refresh_all:
+    connection = db.session.connection()
+    refresh_show_counters(connection, Venue, Shows.venue_id)
+    refresh_show_counters(connection, Artist, Shows.artist_id)
+    db.session.commit()
+    click.echo('show counters of all venues and artists refreshed')
+  else:
+    venues_count, artists_count = roll_over_show_counters(timedelta(hours=hours))
+    click.echo('show counters of {} venues and {} artists refreshed'.format(venues_count, artists_count))
+  venues_cache.clear()
+
+#cities and states of generated venues and artists
+SEED_STATES = ['CA','NY','TX','FL','IL','WA','MA','CO','GA','OR']
+
+@fyyur_cli.command('seed')
+@click.option('--venues', default=10000, help='Number of venues to add.')
+@click.option('--artists', default=10000, help='Number of artists to add.')
+@click.option('--shows', default=1000000, help='Number of shows to add.')
+@click.option('--chunk', default=5000, help='Rows inserted by one statement.')
+def seed_command(venues, artists, shows, chunk):
+  '''Add generated venues, artists and shows, e.g to check query plans on a large dataset.'''
+  random.seed(42)
+  first = {}
+  for model, count in ((Venue, venues), (Artist, artists)):
+    first[model] = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+    for start in range(0, count, chunk):
+      rows = []
+      for n in range(first[model] + start, first[model] + min(start + chunk, count)):
+        row = {
+          'name': '{} {} {}'.format(model.__name__, n, random.choice(SEED_STATES)),
+          'city': 'City {}'.format(n % 1000),
+          'state': SEED_STATES[n % len(SEED_STATES)],
+          'phone': '555-{:03d}-{:04d}'.format(n % 1000, n % 10000),
+          'genres': 'Jazz,Folk',
+        }
+        if model is Venue:
+          row['address'] = '{} Main Street'.format(n)
+        rows.append(row)
+      db.session.execute(model.__table__.insert().values(rows))
+      db.session.commit()
+    click.echo('{} {} added'.format(count, model.__tablename__))
+  #one or two available times a week for artists, between 10:00 and midnight
+  for start in range(0, artists, chunk):
+    rows = []
+    for n in range(first[Artist] + start, first[Artist] + min(start + chunk, artists)):
+      for day in random.sample(range(7), random.randint(1, 2)):
+        hour = random.randint(10, 18)
+        rows.append({'artist_id': n, 'day_of_week': day, 'start_time': datetime.min.time().replace(hour=hour),
+          'end_time': datetime.min.time().replace(hour=random.randint(hour + 2, 23))})
+    db.session.execute(AvailableTimes.__table__.insert().values(rows))
+    db.session.commit()
+  #shows between 3 years ago and a year from now
+  now = datetime.now()
+  with click.progressbar(range(0, shows, chunk), label='adding {} shows'.format(shows)) as chunks:
+    for start in chunks:
+      db.session.execute(Shows.__table__.insert().values([{
+        'venue_id': random.randint(first[Venue], first[Venue] + venues - 1),
+        'artist_id': random.randint(first[Artist], first[Artist] + artists - 1),
+        'start_time': now + timedelta(hours=random.randint(-3 * 365 * 24, 365 * 24)),
+      } for _ in range(min(chunk, shows - start))]))
+      db.session.commit()
+  #venues, artists and shows were inserted without the orm, add their genres and count their shows
+  connection = db.session.connection()
+  refresh_genres(connection, Venue)
+  refresh_genres(connection, Artist)
+  refresh_show_counters(connection, Venue, Shows.venue_id)
+  refresh_show_counters(connection, Artist, Shows.artist_id)
+  db.session.commit()
+  #update the planner statistics
+  db.session.execute('ANALYZE')
+  db.session.commit()
+  venues_cache.clear()
+  availability_cache.clear()
+
+#form validating rows of each kind of import, and model they are inserted into
+IMPORT_KINDS = {
+  'venues': (VenueForm, Venue),
+  'artists': (ArtistForm, Artist),
+  'shows': (ShowForm, Shows),
+}
+
+#rows of a csv file (with a header line) or a json lines file, as (line number, row dict),
+#row is None if the line is not a json object
+def read_import_rows(file, format):
+  if format == 'csv':
+    reader = csv.DictReader(file)
+    for row in reader:
+      yield reader.line_num, row
+  else:
+    for number, line in enumerate(file, 1):
+      if not line.strip():
+        continue
+      try:
+        row = json.loads(line)
+      except ValueError:
+        row = None
+      yield number, row if isinstance(row, dict) else None
+
+#validate a row with the rules of the form fields, as the web forms would,
+#empty fields that are not required are not validated (like the Optional validator),
+#returns the form and errors by field name
+def validate_import_row(form_class, row):
+  formdata = MultiDict()
+  for name, value in row.items():
+    if name == 'genres' and isinstance(value, str):
+      value = value.split(',')
+    if isinstance(value, list):
+      formdata.setlist(name, [str(item) for item in value])
+    elif value is not None:
+      formdata[name] = str(value)
+  form = form_class(formdata, meta={'csrf': False})
+  form.validate()
+  errors = {}
+  for field in form:
+    #missing fields get their default, which is not a value of the row
+    if field.name not in formdata and field.flags.required:
+      errors[field.name] = ['This field is required.']
+    elif field.errors and (field.data or field.flags.required):
+      errors[field.name] = field.errors
+  return form, errors
+
+#column values of a validated form, same as the create handlers
+def import_values(form, model):
+  values = {}
+  for name, value in form.data.items():
+    if name not in model.__table__.c:
+      continue
+    if name == 'genres':
+      value = ','.join(value)
+    elif name in ('seeking_talent', 'seeking_venue'):
+      value = value == 'True'
+    elif name in ('venue_id', 'artist_id'):
+      value = int(value)
+    values[name] = value
+  return values
+
+#set venue_id and artist_id of show rows from ids or names (venue_name, artist_name),
+#with one query per model for all rows, returns errors by line number
+def resolve_show_references(rows):
+  errors = {}
+  for model, prefix in ((Venue, 'venue'), (Artist, 'artist')):
+    ids, names = set(), set()
+    for number, row in rows:
+      if row.get(prefix + '_id'):
+        try:
+          ids.add(int(row[prefix + '_id']))
+        except ValueError:
+          pass
+      elif row.get(prefix + '_name'):
+        names.add(row[prefix + '_name'])
+    found = []
+    if ids or names:
+      found = db.session.query(model.id, model.name)\
+        .filter(or_(model.id.in_(ids), model.name.in_(names))).all()
+    #equivalent sql : select id,name from "Venue" where id in (ids) or name in (names)
+    found_ids = set(item.id for item in found)
+    ids_by_name = dict((item.name, item.id) for item in found)
+    for number, row in rows:
+      if row.get(prefix + '_id'):
+        try:
+          exists = int(row[prefix + '_id']) in found_ids
+        except ValueError:
+          exists = False
+      else:
+        row[prefix + '_id'] = ids_by_name.get(row.get(prefix + '_name'))
+        exists = row[prefix + '_id'] is not None or not row.get(prefix + '_name')
+      if not exists:
+        errors.setdefault(number, {})[prefix + '_id'] = ['{} does not exist'.format(model.__name__)]
+  return errors
+
+#a show of a row accepted by check_show_conflicts
+ImportedShow = namedtuple('ImportedShow', 'venue_id artist_id start_time')
+
+class ImportResult(object):
+  '''
+  counts of an import, and ids of venues and artists having new shows
+  '''
+  def __init__(self):
+    self.read = 0
+    self.imported = 0
+    self.errors = 0
+    self.venue_ids = set()
+    self.artist_ids = set()
+
+#show rows having conflicts (see show_conflicts) with booked shows, or with shows
+#of rows before them in the chunk (not inserted yet), are moved to errors,
+#available times and booked shows of the chunk are loaded with one query each,
+#returns the rows without conflicts
+def check_show_conflicts(valid, errors):
+  if not valid:
+    return valid
+  venue_ids = set(values['venue_id'] for number, row, values in valid)
+  artist_ids = set(values['artist_id'] for number, row, values in valid)
+  starts = [values['start_time'] for number, row, values in valid]
+  first, last = show_slot(min(starts))[0], show_slot(max(starts))[1]
+  slot = last - max(starts)
+  times = {}
+  for available in AvailableTimes.query.filter(AvailableTimes.artist_id.in_(artist_ids)):
+    times.setdefault(available.artist_id, []).append(available)
+  #equivalent sql : select * from "AvailableTimes" where artist_id in (artist_ids)
+  shows_of = {}
+  booked = db.session.query(Shows.venue_id, Shows.artist_id, Shows.start_time)\
+    .filter(or_(Shows.venue_id.in_(venue_ids), Shows.artist_id.in_(artist_ids)))\
+    .filter(Shows.start_time > first - slot, Shows.start_time < last)
+  #equivalent sql : select venue_id,artist_id,start_time from "Shows" where (venue_id in (venue_ids) or artist_id in (artist_ids))
+  #.................and start_time > first start - slot and start_time < last end
+  def book(show):
+    shows_of.setdefault(('venue', show.venue_id), []).append(show)
+    shows_of.setdefault(('artist', show.artist_id), []).append(show)
+  for show in booked:
+    book(show)
+  accepted = []
+  for number, row, values in valid:
+    start, end = show_slot(values['start_time'])
+    shows = shows_of.get(('venue', values['venue_id']), []) + shows_of.get(('artist', values['artist_id']), [])
+    conflicts = slot_conflicts(values['venue_id'], values['artist_id'], start, end, times.get(values['artist_id']), shows)
+    if conflicts:
+      errors[number] = {'conflicts': conflicts}
+    else:
+      book(ImportedShow(values['venue_id'], values['artist_id'], start))
+      accepted.append((number, row, values))
+  return accepted
+
+#validate and insert rows of a chunk in one transaction,
+#rows failing validation (or insertion) are passed to error(number, row, errors),
+#shows are checked for conflicts as in the web form, unless check_conflicts is False
+def import_chunk(kind, rows, result, error, check_conflicts=True):
+  form_class, model = IMPORT_KINDS[kind]
+  result.read += len(rows)
+  errors = resolve_show_references(rows) if kind == 'shows' else {}
+  valid = []
+  for number, row in rows:
+    if number not in errors:
+      form, row_errors = validate_import_row(form_class, row)
+      if row_errors:
+        errors[number] = row_errors
+      else:
+        valid.append((number, row, import_values(form, model)))
+  if model is Shows and check_conflicts:
+    valid = check_show_conflicts(valid, errors)
+  if model is not Shows:
+    #names are unique, in the database and in the chunk
+    names = set(values['name'] for number, row, values in valid)
+    taken = set(name for name, in db.session.query(model.name).filter(model.name.in_(names)))
+    unique = []
+    for number, row, values in valid:
+      if values['name'] in taken:
+        errors[number] = {'name': ['{} already exists'.format(model.__name__)]}
+      else:
+        taken.add(values['name'])
+        unique.append((number, row, values))
+    valid = unique
+  for number, row in rows:
+    if number in errors:
+      error(number, row, errors[number])
+  result.errors += len(errors)
+  if not valid:
+    return
+  try:
+    insert_import_rows(model, [values for number, row, values in valid], result)
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    #insert rows one at a time to find the failing ones
+    for number, row, values in valid:
+      try:
+        insert_import_rows(model, [values], result)
+        db.session.commit()
+      except Exception as e:
+        db.session.rollback()
+        result.errors += 1
+        error(number, row, {'row': [str(getattr(e, 'orig', e))]})
+
+#insert rows with one statement, rows are inserted without the orm, so genres of
+#new venues and artists are added here, and show counters are refreshed after the import
+def insert_import_rows(model, rows, result):
+  connection = db.session.connection()
+  connection.execute(model.__table__.insert(), rows)
+  if model is Shows:
+    result.venue_ids.update(row['venue_id'] for row in rows)
+    result.artist_ids.update(row['artist_id'] for row in rows)
+  else:
+    ids = [model_id for model_id, in db.session.query(model.id).filter(model.name.in_([row['name'] for row in rows]))]
+    refresh_genres(connection, model, ids)
+  result.imported += len(rows)
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), help='File format, default is csv for .csv files and ndjson otherwise.')
+@click.option('--chunk', default=1000, help='Rows inserted by one transaction.')
+@click.option('--errors', 'errors_path', help='File of rejected rows (json lines), default is FILE.errors.jsonl.')
+@click.option('--skip-conflicts', is_flag=True, help='Do not check shows for availability and double booking (faster, for trusted files).')
+def import_command(kind, file, file_format, chunk, errors_path, skip_conflicts):
+  '''Import venues, artists or shows from a csv or json lines file, rows are validated as in the web forms.'''
+  file_format = file_format or ('csv' if file.name.endswith('.csv') else 'ndjson')
+  errors_path = errors_path or (file.name if file.name != '<stdin>' else kind) + '.errors.jsonl'
+  errors_file = None
+  def error(number, row, errors):
+    nonlocal errors_file
+    if errors_file is None:
+      errors_file = open(errors_path, 'w', encoding='utf-8')
+    errors_file.write(json.dumps({'line': number, 'errors': errors, 'row': row}, default=str) + '\n')
+  result = ImportResult()
+  started = time.monotonic()
+  rows = []
+  try:
+    for number, row in read_import_rows(file, file_format):
+      if row is None:
+        result.read += 1
+        result.errors += 1
+        error(number, None, {'row': ['not a json object']})
+        continue
+      rows.append((number, row))
+      if len(rows) == chunk:
+        import_chunk(kind, rows, result, error, not skip_conflicts)
+        rows = []
+        click.echo('{} rows read, {} imported, {} errors, {:.0f} rows/s'.format(
+          result.read, result.imported, result.errors, result.read / (time.monotonic() - started)))
+    if rows:
+      import_chunk(kind, rows, result, error, not skip_conflicts)
+  finally:
+    if errors_file is not None:
+      errors_file.close()
+  if kind == 'shows':
+    #shows were inserted without the orm, count shows of their venues and artists
+    venue_ids, artist_ids = sorted(result.venue_ids), sorted(result.artist_ids)
+    connection = db.session.connection()
+    for start in range(0, max(len(venue_ids), len(artist_ids)), chunk):
+      refresh_show_counters(connection, Venue, Shows.venue_id, venue_ids[start:start + chunk])
+      refresh_show_counters(connection, Artist, Shows.artist_id, artist_ids[start:start + chunk])
+    db.session.commit()
+  venues_cache.clear()
+  typeahead_cache.clear()
+  click.echo('{} rows read, {} imported, {} errors in {:.1f}s'.format(
+    result.read, result.imported, result.errors, time.monotonic() - started))
+  if result.errors:
+    click.echo('rejected rows written to {}'.format(errors_path), err=True)
+
+#queries of routes filtering on indexed columns, as (route, query, expected index names)
+def explain_queries():
+  show = Shows.query.order_by(Shows.id).first()
+  venue = Venue.query.get(show.venue_id)
+  artist = Artist.query.get(show.artist_id)
+  limit = app.config.get('DETAIL_SHOWS_LIMIT')
+  queries = [
+    ('show_venue', detail_page_query(Venue, venue.id, limit)[0], ['ix_shows_venue_start_time']),
+    ('show_artist', detail_page_query(Artist, artist.id, limit)[0], ['ix_shows_artist_start_time']),
+    ('shows', shows_query('upcoming').limit(app.config.get('SHOWS_PER_PAGE', 60) + 1), ['ix_shows_start_time']),
+    ('search_place_venues', Venue.query.filter(Venue.city==venue.city,Venue.state==venue.state), ['ix_venue_city_state']),
+    ('search_place_artists', Artist.query.filter(Artist.city==artist.city,Artist.state==artist.state), ['ix_artist_city_state']),
+    ('genre_venues', genre_query(Venue, 'Jazz').limit(21), ['ix_venue_genres_genre_id']),
+    ('genre_artists', genre_query(Artist, 'Jazz').limit(21), ['ix_artist_genres_genre_id']),
+    ('available_artists', AvailableTimes.query.with_entities(AvailableTimes.start_time, AvailableTimes.end_time, AvailableTimes.artist_id).filter(AvailableTimes.day_of_week == 4), ['ix_AvailableTimes_day_of_week']),
+  ]
+  #ilike '%term%' can only use the trigram indexes of postgresql
+  if db.engine.dialect.name == 'postgresql':
+    queries += [
+      ('search_venues', name_search_query(Venue, venue.name[-8:]).limit(21), ['ix_venue_name_trgm']),
+      ('search_artists', name_search_query(Artist, artist.name[-8:]).limit(21), ['ix_artist_name_trgm']),
+      ('typeahead_venues', Venue.query.filter(func.lower(Venue.name).like(venue.name[:4].lower() + '%')).order_by(func.lower(Venue.name)).limit(10), ['ix_venue_name_prefix']),
+      ('typeahead_artists', Artist.query.filter(func.lower(Artist.name).like(artist.name[:4].lower() + '%')).order_by(func.lower(Artist.name)).limit(10), ['ix_artist_name_prefix']),
+    ]
+  return queries
+
+#query plan of a query, as text lines
+def explain(query):
+  compiled = query.statement.compile(dialect=db.engine.dialect)
+  params = compiled.params
+  if compiled.positional:
+    params = [params[name] for name in compiled.positiontup]
+  if db.engine.dialect.name == 'postgresql':
+    rows = db.session.connection().execute('EXPLAIN ' + str(compiled), params)
+  else:
+    rows = db.session.connection().execute('EXPLAIN QUERY PLAN ' + str(compiled), params)
+  return [row[-1] for row in rows]
+
+@fyyur_cli.command('explain')
+@click.option('--verbose', is_flag=True, help='Print query plans of all routes.')
+def explain_command(verbose):
+  '''Check that queries of routes use their indexes, exits with 1 if one does not.'''
+  if Shows.query.first() is None:
+    raise click.ClickException('no shows, add some first, e.g with "flask fyyur seed"')
+  click.echo('{} venues, {} artists, {} shows'.format(
+    Venue.query.count(), Artist.query.count(), Shows.query.count()))
+  failed = 0
+  for route, query, indexes in explain_queries():
+    plan = explain(query)
+    used = [index for index in indexes if any(index in line for line in plan)]
+    if not used:
+      failed += 1
+    click.echo('{:<24} {:<6} {}'.format(route, 'ok' if used else 'FAIL', ', '.join(used) or 'expected ' + ', '.join(indexes)))
+    if verbose or not used:
+      for line in plan:
+        click.echo('    ' + line)
+  if failed:
+    raise SystemExit(1)
+
+app.cli.add_command(fyyur_cli)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
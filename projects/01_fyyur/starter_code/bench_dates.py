@@ -0,0 +1,82 @@
+#----------------------------------------------------------------------------#
+# Micro-benchmark of show dates formatting on the /shows page.
+#   old: start_time formatted by to_char in sql, parsed again by dateutil
+#        and formatted by babel in the datetime filter, for every row
+#   new: start_time is a datetime, formatted with a compiled babel pattern
+# $ python bench_dates.py --rows 5000
+# no database is used, rows are generated
+#----------------------------------------------------------------------------#
+
+import argparse
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+import dateutil.parser
+import babel.dates
+from app import app, format_datetime, ShowsPage
+
+ShowRow = namedtuple('ShowRow', 'id start_time venue_id venue_name artist_id artist_name artist_image_link')
+
+#the datetime filter before, start_time was a string of to_char
+def old_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+def show_rows(count, old):
+  start = datetime(2035, 4, 1, 20, 0)
+  rows = []
+  for number in range(count):
+    start_time = start + timedelta(minutes=37 * number)
+    if old:
+      #what to_char(start_time, 'DD Mon YYYY HH:MM:SS') returned
+      start_time = start_time.strftime('%d %b %Y %H:%m:%S')
+    rows.append(ShowRow(number, start_time, 1, 'The Musical Hop', 1, 'Guns N Petals', 'https://example.com/artist.jpg'))
+  return rows
+
+#best of rounds, in seconds
+def measure(run, rounds):
+  best = None
+  for _ in range(rounds):
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+def render_page(rows):
+  template = app.jinja_env.get_template('pages/shows.html')
+  return template.render(shows=ShowsPage(rows, len(rows)), filters={'when': 'upcoming'}, page_url=lambda cursor: '')
+
+def main():
+  parser = argparse.ArgumentParser(description='per row cost of show dates on the /shows page, old against new')
+  parser.add_argument('--rows', type=int, default=5000)
+  parser.add_argument('--rounds', type=int, default=5)
+  args = parser.parse_args()
+
+  old_rows = show_rows(args.rows, old=True)
+  new_rows = show_rows(args.rows, old=False)
+  filters = app.jinja_env.filters
+  with app.test_request_context('/shows'):
+    results = []
+    #the filter alone
+    old = measure(lambda: [old_format_datetime(row.start_time, 'full') for row in old_rows], args.rounds)
+    new = measure(lambda: [format_datetime(row.start_time, 'full') for row in new_rows], args.rounds)
+    results.append(('datetime filter', old, new))
+    #the whole page, template rendering included
+    filters['datetime'] = old_format_datetime
+    old = measure(lambda: render_page(old_rows), args.rounds)
+    filters['datetime'] = format_datetime
+    new = measure(lambda: render_page(new_rows), args.rounds)
+    results.append(('/shows page', old, new))
+
+  print('{} rows, best of {} rounds'.format(args.rows, args.rounds))
+  print('{:<16} {:>14} {:>14} {:>9}'.format('', 'old us/row', 'new us/row', 'speedup'))
+  for name, old, new in results:
+    print('{:<16} {:>14.2f} {:>14.2f} {:>8.1f}x'.format(name, old / args.rows * 1e6, new / args.rows * 1e6, old / new))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,44 @@
+"""indexes for shows, city and state, and name search
+
+Revision ID: 3c9d1b7e5a22
+Revises: 8b3e4f60c2a4
+Create Date: 2026-10-18 18:02:41.270318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d1b7e5a22'
+down_revision = '8b3e4f60c2a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_start_time', 'Shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_start_time', 'Shows', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_start_time', 'Shows', ['start_time'], unique=False)
+    op.create_index(op.f('ix_AvailableTimes_artist_id'), 'AvailableTimes', ['artist_id'], unique=False)
+    op.create_index('ix_venue_city_state', 'Venue', ['city', 'state'], unique=False)
+    op.create_index('ix_artist_city_state', 'Artist', ['city', 'state'], unique=False)
+
+    # trigram indexes answer name ilike '%term%' searches, postgresql only
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artist_name_trgm', 'Artist', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_venue_name_trgm', table_name='Venue')
+    op.drop_index('ix_artist_city_state', table_name='Artist')
+    op.drop_index('ix_venue_city_state', table_name='Venue')
+    op.drop_index(op.f('ix_AvailableTimes_artist_id'), table_name='AvailableTimes')
+    op.drop_index('ix_shows_start_time', table_name='Shows')
+    op.drop_index('ix_shows_artist_start_time', table_name='Shows')
+    op.drop_index('ix_shows_venue_start_time', table_name='Shows')
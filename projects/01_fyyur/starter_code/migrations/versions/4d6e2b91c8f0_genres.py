@@ -0,0 +1,56 @@
+"""genre table and venue and artist genres
+
+Revision ID: 4d6e2b91c8f0
+Revises: 7a41d2c8e913
+Create Date: 2026-10-18 19:12:44.301587
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d6e2b91c8f0'
+down_revision = '7a41d2c8e913'
+branch_labels = None
+depends_on = None
+
+# values of the Genres enum of forms.py when this migration was written
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+          'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+          'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other']
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(genre, [{'name': name} for name in GENRES])
+    for table, owner, column in (('venue_genres', 'Venue', 'venue_id'), ('artist_genres', 'Artist', 'artist_id')):
+        op.create_table(table,
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint([column], [owner + '.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(column, 'genre_id')
+        )
+        op.create_index('ix_{}_genre_id'.format(table), table, ['genre_id', column], unique=False)
+
+        # genres of existing venues and artists, from their comma separated genres column,
+        # names that are not a Genre stay in the column only
+        op.execute(
+            'INSERT INTO {table} ({column}, genre_id) '
+            'SELECT "{owner}".id, "Genre".id FROM "{owner}", "Genre" '
+            'WHERE \',\' || "{owner}".genres || \',\' LIKE \'%,\' || "Genre".name || \',%\''
+            .format(table=table, owner=owner, column=column))
+
+
+def downgrade():
+    op.drop_index('ix_artist_genres_genre_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_genre_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_table('Genre')
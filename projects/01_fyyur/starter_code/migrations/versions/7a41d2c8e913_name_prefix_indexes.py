@@ -0,0 +1,30 @@
+"""name prefix indexes for typeahead
+
+Revision ID: 7a41d2c8e913
+Revises: 3c9d1b7e5a22
+Create Date: 2026-10-18 18:31:05.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a41d2c8e913'
+down_revision = '3c9d1b7e5a22'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # lower(name) like 'term%' in name order, text_pattern_ops makes like
+    # prefix matches use the index whatever the database collation is
+    op.create_index('ix_venue_name_prefix', 'Venue', [sa.text('lower(name)')], unique=False,
+                    postgresql_ops={'lower(name)': 'text_pattern_ops'})
+    op.create_index('ix_artist_name_prefix', 'Artist', [sa.text('lower(name)')], unique=False,
+                    postgresql_ops={'lower(name)': 'text_pattern_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_prefix', table_name='Artist')
+    op.drop_index('ix_venue_name_prefix', table_name='Venue')
@@ -0,0 +1,44 @@
+"""upcoming and past show counters of venues and artists
+
+Revision ID: 8b3e4f60c2a4
+Revises: 5f1c2a7d9e01
+Create Date: 2026-10-18 17:40:12.514903
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3e4f60c2a4'
+down_revision = '5f1c2a7d9e01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # count shows of existing venues and artists, split at the app's clock
+    # (naive local datetime.now(), as the counter events and rollover),
+    # not CURRENT_TIMESTAMP which is utc on sqlite and session time zone on postgresql
+    now = datetime.now()
+    for table, column in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(id) FROM "Shows" '
+            'WHERE "Shows".{column} = "{table}".id AND "Shows".start_time >= :now), '
+            'past_shows_count = (SELECT count(id) FROM "Shows" '
+            'WHERE "Shows".{column} = "{table}".id AND "Shows".start_time < :now)'
+            .format(table=table, column=column)).bindparams(
+                sa.bindparam('now', now, type_=sa.DateTime())))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,27 @@
+"""available times by day of week index
+
+Revision ID: 9e5f3a2c7b14
+Revises: 4d6e2b91c8f0
+Create Date: 2026-10-18 19:48:20.117354
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e5f3a2c7b14'
+down_revision = '4d6e2b91c8f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # available times of all artists on a day of week, covering the
+    # columns read to build the availability interval tree of that day
+    op.create_index('ix_AvailableTimes_day_of_week', 'AvailableTimes',
+                    ['day_of_week', 'start_time', 'end_time', 'artist_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_AvailableTimes_day_of_week', table_name='AvailableTimes')
@@ -0,0 +1,266 @@
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from flaskr import create_app, QUESTIONS_PER_PAGE
+from models import Question
+from bench_quiz import seed_questions, WORDS, CATEGORIES
+
+# dataset sizes that can be given by name to --size
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+
+# requests of every measured route, each call returns a new
+# (method, path, json body) with random page, term, category, ...
+def build_routes(ids):
+    pages = max(1, len(ids) // QUESTIONS_PER_PAGE)
+    category_pages = max(1, pages // len(CATEGORIES))
+
+    def category_id():
+        return random.randint(1, len(CATEGORIES))
+
+    return {
+        'GET /questions': lambda: (
+            'GET', '/questions?page={}'.format(random.randint(1, pages)),
+            None),
+        'GET /questions?after_id': lambda: (
+            'GET', '/questions?after_id={}'.format(random.choice(ids)),
+            None),
+        'GET /categories/<id>/questions': lambda: (
+            'GET', '/categories/{}/questions?page={}'.format(
+                category_id(), random.randint(1, category_pages)),
+            None),
+        'GET /categories': lambda: ('GET', '/categories', None),
+        'POST /search': lambda: (
+            'POST', '/search', {'searchTerm': random.choice(WORDS)}),
+        'POST /quizzes': lambda: (
+            'POST', '/quizzes', {
+                'previous_questions': random.sample(ids, min(20, len(ids))),
+                'quiz_category': {'id': random.randint(0, len(CATEGORIES))},
+            }),
+    }
+
+
+'''
+ClientDriver
+    sends requests through the flask test client, no network,
+    measures the app itself
+'''
+class ClientDriver:
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def connect(self):
+        client = self.app.test_client()
+
+        def send(method, path, body):
+            return client.open(path, method=method, json=body).status_code
+        return send
+
+
+# http/1.1 keep-alive, no nagle delay, no request log lines
+class KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+'''
+ServerDriver
+    sends requests over http to the app running in a threaded
+    WSGI server, one keep-alive connection per client thread
+'''
+class ServerDriver:
+    name = 'server'
+
+    def __init__(self, app):
+        self.server = make_server(
+            '127.0.0.1', 0, app, threaded=True,
+            request_handler=KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def connect(self):
+        connection = http.client.HTTPConnection(
+            '127.0.0.1', self.server.server_port)
+        connection.connect()
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def send(method, path, body):
+            headers = {}
+            data = None
+            if body is not None:
+                data = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        return send
+
+
+# send requests of one route from concurrency threads,
+# returns latency percentiles in milliseconds and throughput
+def run_route(driver, make_request, requests, concurrency, warmup=5):
+    timings = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(count):
+        send = driver.connect()
+        for _ in range(warmup):
+            send(*make_request())
+        own = []
+        for _ in range(count):
+            method, path, body = make_request()
+            start = time.perf_counter()
+            status = send(method, path, body)
+            own.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            timings.extend(own)
+
+    counts = [requests // concurrency] * concurrency
+    counts[0] += requests % concurrency
+    threads = [threading.Thread(target=worker, args=(count,))
+               for count in counts]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': errors[0],
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p99_ms': round(
+            timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'throughput_rps': round(len(timings) / elapsed, 1),
+    }
+
+
+# print results, with change against a previous results file
+def print_results(results, previous=None):
+    for mode, routes in results['modes'].items():
+        print('\n{} ({} questions, concurrency {})'.format(
+            mode, results['questions'], results['concurrency']))
+        print('{:<34} {:>9} {:>9} {:>10} {:>7} {:>18}'.format(
+            'route', 'p50 ms', 'p99 ms', 'req/s', 'errors',
+            'p50/p99 change'))
+        for route, stats in routes.items():
+            change = ''
+            if previous:
+                old = previous.get('modes', {}).get(mode, {}).get(route)
+                if old:
+                    change = '{:+.0%} / {:+.0%}'.format(
+                        stats['p50_ms'] / old['p50_ms'] - 1,
+                        stats['p99_ms'] / old['p99_ms'] - 1)
+            print('{:<34} {:>9.3f} {:>9.3f} {:>10.1f} {:>7} {:>18}'.format(
+                route, stats['p50_ms'], stats['p99_ms'],
+                stats['throughput_rps'], stats['errors'], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='latency and throughput of the trivia API routes')
+    parser.add_argument('--size', default='10k',
+                        help='number of questions, 1k, 10k, 100k, 1m '
+                        'or a number')
+    parser.add_argument('--database', default=None,
+                        help='database url, e.g. an ephemeral postgresql, '
+                        'default is a temporary sqlite file per size')
+    parser.add_argument('--mode', choices=['client', 'server', 'both'],
+                        default='both')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--routes', default=None,
+                        help='comma separated route names to run')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', default=None,
+                        help='previous results file to compare with')
+    parser.add_argument('--fast-json', action='store_true',
+                        help='run the app with the FAST_JSON path')
+    args = parser.parse_args()
+
+    size = SIZES.get(args.size.lower()) or int(args.size)
+    database = args.database or 'sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'trivia_bench_{}.db'.format(size))
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database,
+        'FAST_JSON': args.fast_json,
+    })
+    with app.app_context():
+        seed_questions(size)
+        ids = [q_id for q_id, in Question.query.with_entities(Question.id)]
+
+    routes = build_routes(ids)
+    if args.routes:
+        routes = {name: routes[name] for name in args.routes.split(',')}
+    drivers = {'client': ClientDriver, 'server': ServerDriver}
+    modes = ['client', 'server'] if args.mode == 'both' else [args.mode]
+
+    results = {
+        'created': datetime.datetime.utcnow().isoformat(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        'questions': len(ids),
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'fast_json': args.fast_json,
+        'modes': {}
+    }
+    for mode in modes:
+        driver = drivers[mode](app)
+        driver.start()
+        results['modes'][mode] = {
+            name: run_route(
+                driver, make_request, args.requests, args.concurrency)
+            for name, make_request in routes.items()}
+        driver.stop()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_results(results, previous)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('\nresults written to {}'.format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flaskr import create_app
+from models import db, Question, Category
+from quiz import quiz_sessions
+
+# lengths of previous_questions list to measure
+PREVIOUS_LENGTHS = [0, 10, 100, 500, 1000, 5000]
+
+
+# words used to generate questions text, so searches match a few rows
+WORDS = [
+    'river', 'planet', 'painter', 'king', 'movie', 'football', 'ocean',
+    'element', 'novel', 'mountain', 'city', 'war', 'actor', 'olympic',
+    'desert', 'poet', 'island', 'empire', 'song', 'theory', 'bridge',
+    'galaxy', 'opera', 'castle', 'volcano', 'sculpture', 'queen', 'comet',
+    'treaty', 'album', 'forest', 'scientist', 'dynasty', 'lake', 'museum',
+    'inventor', 'glacier', 'symphony', 'president', 'temple',
+]
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment',
+              'Sports']
+
+
+# insert categories and generated questions until the table
+# has count questions, using multi-row inserts, one commit per chunk
+def seed_questions(count, chunk=5000):
+    if not Category.query.count():
+        db.session.execute(Category.__table__.insert(), [
+            {'type': name} for name in CATEGORIES])
+        db.session.commit()
+    existing = Question.query.count()
+    while existing < count:
+        size = min(chunk, count - existing)
+        db.session.execute(Question.__table__.insert(), [{
+            'question': 'Which {} {} question {}?'.format(
+                WORDS[n % len(WORDS)], WORDS[n * 7 % len(WORDS)], n),
+            'answer': 'Answer {} {}'.format(WORDS[n * 13 % len(WORDS)], n),
+            'category': str(n % len(CATEGORIES) + 1),
+            'difficulty': n % 5 + 1,
+        } for n in range(existing, existing + size)])
+        db.session.commit()
+        existing += size
+
+
+# time a function, returns (p50, p99, mean) in milliseconds
+def measure(function, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return timings[len(timings) // 2], p99, sum(timings) / len(timings)
+
+
+# the NOT IN (...) first() query used by /quizzes before the question pool
+def legacy_pick(category, previous_questions):
+    selection = Question.query
+    if previous_questions:
+        selection = selection.filter(~Question.id.in_(previous_questions))
+    if category:
+        selection = selection.filter(Question.category == str(category))
+    return selection.first()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='/quizzes latency against previous_questions length')
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--category', type=int, default=0,
+                        help='quiz category id, 0 for all categories')
+    parser.add_argument('--database', default=None,
+                        help='database url, default is a temporary sqlite')
+    args = parser.parse_args()
+
+    database = args.database or 'sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'trivia_bench_{}.db'.format(args.questions))
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database})
+    client = app.test_client()
+
+    with app.app_context():
+        seed_questions(args.questions)
+        selection = Question.query.with_entities(Question.id)
+        if args.category:
+            selection = selection.filter(
+                Question.category == str(args.category))
+        ids = [q_id for q_id, in selection]
+
+        # first quiz question builds the question pool, not measured
+        client.post('/quizzes', json={'quiz_category': {'id': 0}})
+        print('{} questions, category {}, {} rounds'.format(
+            len(ids), args.category, args.rounds))
+        print('{:>10} {:>22} {:>22} {:>22}'.format(
+            'previous', '/quizzes p50/p99 ms', 'session p50/p99 ms',
+            'NOT IN p50/p99 ms'))
+        for length in PREVIOUS_LENGTHS:
+            if length >= len(ids):
+                break
+            previous = random.sample(ids, length)
+            body = {
+                'previous_questions': previous,
+                'quiz_category': {'id': args.category},
+            }
+            p50, p99, _ = measure(
+                lambda: client.post('/quizzes', json=body), args.rounds)
+            # a quiz session that already played the same questions,
+            # the next question call does not send them
+            session = quiz_sessions.create(args.category)
+            for q_id in previous:
+                session.seen.add(q_id)
+            url = '/quizzes/sessions/{}/next'.format(session.id)
+            session_p50, session_p99, _ = measure(
+                lambda: client.post(url), args.rounds)
+            legacy_p50, legacy_p99, _ = measure(
+                lambda: legacy_pick(args.category, previous), args.rounds)
+            print('{:>10} {:>10.3f} {:>11.3f} {:>10.3f} {:>11.3f} '
+                  '{:>10.3f} {:>11.3f}'.format(
+                      length, p50, p99, session_p50, session_p99,
+                      legacy_p50, legacy_p99))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import tempfile
+from flask import jsonify
+
+from flaskr import create_app
+from models import Question
+from serializer import select_rows, format_rows, json_response, orjson
+from bench_quiz import seed_questions, measure
+
+# number of questions in one serialized list
+ROW_COUNTS = [10, 100, 1000, 10000]
+
+
+# the default path: ORM objects, Question.format() and jsonify
+def default_path(count):
+    questions = Question.query.order_by(Question.id.desc()).limit(count)
+    return jsonify({
+        'success': True,
+        'questions': [question.format() for question in questions]
+    })
+
+
+# the FAST_JSON path: column rows and the fast serializer
+def fast_path(count):
+    rows = select_rows(Question.query).order_by(Question.id.desc())\
+        .limit(count)
+    return json_response({
+        'success': True,
+        'questions': format_rows(rows)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='questions list serialization, default against '
+        'FAST_JSON path')
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--database', default=None,
+                        help='database url, default is a temporary sqlite')
+    args = parser.parse_args()
+
+    database = args.database or 'sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'trivia_bench_{}.db'.format(args.questions))
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database})
+
+    with app.test_request_context():
+        seed_questions(args.questions)
+        print('{} questions, {} rounds, encoder {}'.format(
+            args.questions, args.rounds,
+            'orjson' if orjson is not None else 'json'))
+        print('{:>8} {:>22} {:>22} {:>9}'.format(
+            'rows', 'default p50/p99 ms', 'fast p50/p99 ms', 'speedup'))
+        for count in ROW_COUNTS:
+            if count > args.questions:
+                break
+            default = measure(lambda: default_path(count), args.rounds)
+            fast = measure(lambda: fast_path(count), args.rounds)
+            print('{:>8} {:>22} {:>22} {:>8.1f}x'.format(
+                count,
+                '{:.3f} / {:.3f}'.format(default[0], default[1]),
+                '{:.3f} / {:.3f}'.format(fast[0], fast[1]),
+                default[0] / fast[0]))
+
+
+if __name__ == "__main__":
+    main()
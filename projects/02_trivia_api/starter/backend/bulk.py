@@ -0,0 +1,168 @@
+import csv
+import json
+
+from models import db, Question
+from search import memory_search
+from quiz import question_pool
+from counts import question_counts
+
+# rows inserted by one multi-row INSERT statement, and one commit
+BATCH_SIZE = 200
+# rows fetched at once by the export server-side cursor
+EXPORT_CHUNK_SIZE = 1000
+# errors returned in import response, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+FIELDS = ('question', 'answer', 'difficulty', 'category')
+
+
+'''
+ImportResult
+    number of inserted questions, number of failed rows,
+    and the first errors as {'line': line number, 'message': reason}
+'''
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def format(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors
+        }
+
+
+'''
+read_ndjson(lines)
+    yields (line number, row dict or error message) for every
+    non empty line of a JSON Lines body
+'''
+def read_ndjson(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, 'invalid json'
+            continue
+        if not isinstance(row, dict):
+            yield number, 'expected a json object'
+            continue
+        yield number, row
+
+
+'''
+read_csv(lines)
+    yields (line number, row dict) for every row of a CSV body,
+    first line is the header, e.g question,answer,difficulty,category
+'''
+def read_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+'''
+validate(row)
+    returns the values to insert for a row, or raises ValueError,
+    same required fields as POST /questions
+'''
+def validate(row):
+    values = {field: row.get(field) for field in FIELDS}
+    missing = [field for field in FIELDS if values[field] in (None, '')]
+    if missing:
+        raise ValueError('missing ' + ', '.join(missing))
+    try:
+        values['difficulty'] = int(values['difficulty'])
+    except (TypeError, ValueError):
+        raise ValueError('difficulty must be an integer')
+    values['category'] = str(values['category'])
+    return values
+
+
+'''
+insert_batch(batch, result)
+    inserts (line number, values) pairs with one multi-row INSERT,
+    if it fails the rows are inserted one at a time,
+    so only the rows that fail are reported
+'''
+def insert_batch(batch, result):
+    # one INSERT ... VALUES (...), (...) statement for the whole batch
+    try:
+        db.session.execute(
+            Question.__table__.insert().values([row for _, row in batch]))
+        db.session.commit()
+        result.inserted += len(batch)
+        return
+    except Exception:
+        db.session.rollback()
+    for line, row in batch:
+        try:
+            db.session.execute(Question.__table__.insert().values(row))
+            db.session.commit()
+            result.inserted += 1
+        except Exception:
+            db.session.rollback()
+            result.error(line, 'could not be inserted')
+
+
+'''
+import_questions(rows)
+    inserts questions from (line number, row) pairs in batches,
+    rows that are not valid are skipped and reported,
+    returns ImportResult
+'''
+def import_questions(rows):
+    result = ImportResult()
+    batch = []
+    for line, row in rows:
+        if isinstance(row, str):
+            result.error(line, row)
+            continue
+        try:
+            batch.append((line, validate(row)))
+        except ValueError as e:
+            result.error(line, str(e))
+            continue
+        if len(batch) >= BATCH_SIZE:
+            insert_batch(batch, result)
+            batch = []
+    if batch:
+        insert_batch(batch, result)
+    if result.inserted:
+        # rows were inserted without the ORM, so questions events
+        # did not run, build search index, quiz pool and counts again
+        memory_search.reset()
+        question_pool.reset()
+        question_counts.reset()
+    return result
+
+
+'''
+export_questions()
+    yields every question as a JSON line, ordered by id,
+    read through a server-side cursor, so memory use stays flat
+'''
+def export_questions():
+    rows = db.session.query(
+        Question.id, Question.question, Question.answer,
+        Question.difficulty, Question.category)\
+        .order_by(Question.id)\
+        .execution_options(stream_results=True)\
+        .yield_per(EXPORT_CHUNK_SIZE)
+    for q_id, question, answer, difficulty, category in rows:
+        yield json.dumps({
+            'id': q_id,
+            'question': question,
+            'answer': answer,
+            'difficulty': difficulty,
+            'category': category
+        }) + '\n'
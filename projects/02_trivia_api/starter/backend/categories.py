@@ -0,0 +1,95 @@
+import hashlib
+import json
+import threading
+import time
+from sqlalchemy import event
+
+from models import db, Category
+
+# categories changed by other server processes (or directly in the
+# database) are picked up when the cache is built again
+REFRESH_SECONDS = 60
+
+
+'''
+CategoryCache
+    formatted categories list, with the /categories response body
+    serialized once, and its ETag, built again when categories change
+    hits and misses (builds) are counted, see stats()
+'''
+class CategoryCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cached = None
+        self.built_at = 0
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self):
+        # cache is built again on next use
+        with self.lock:
+            self.cached = None
+
+    def build(self):
+        categories = [cat.format() for cat in
+                      Category.query.order_by(Category.id).all()]
+        body = json.dumps({
+            'success': True,
+            'categories': categories
+        }, separators=(',', ':'), sort_keys=True)
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        return categories, body, etag
+
+    def get(self):
+        with self.lock:
+            if self.cached is None or \
+                    time.time() - self.built_at > REFRESH_SECONDS:
+                self.cached = self.build()
+                self.built_at = time.time()
+                self.misses += 1
+            else:
+                self.hits += 1
+            return self.cached
+
+    '''
+    categories()
+        returns a copy of the list of formatted categories,
+        callers may change it without changing the cache
+    '''
+    def categories(self):
+        return [dict(category) for category in self.get()[0]]
+
+    '''
+    response_body()
+        returns (body, etag) of the /categories json response
+    '''
+    def response_body(self):
+        return self.get()[1:]
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+category_cache = CategoryCache()
+
+
+'''
+init_categories(app)
+    empties the category cache, it is built on first use
+'''
+def init_categories(app):
+    category_cache.reset()
+
+
+# categories changed, build the cache again
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def category_changed(mapper, connection, category):
+    category_cache.reset()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def session_rolled_back(session, previous_transaction):
+    category_cache.reset()
@@ -0,0 +1,98 @@
+import threading
+import time
+from sqlalchemy import event, func
+
+from models import db, Question
+
+# counts are checked against the database this often,
+# to pick up questions added or deleted by other server processes
+RECONCILE_SECONDS = 300
+
+
+'''
+QuestionCounts
+    number of questions, for all questions and per category,
+    counted once with one GROUP BY query, then kept up to date
+    by Question insert and delete, so endpoints do not run COUNT(*)
+    hits and misses (counting queries) are counted, see stats()
+'''
+class QuestionCounts:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = None
+        self.reconciled_at = 0
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self):
+        # counts are queried again on next use
+        with self.lock:
+            self.counts = None
+
+    def reconcile(self):
+        rows = db.session.query(Question.category, func.count(Question.id))\
+            .group_by(Question.category).all()
+        self.counts = {str(category): count for category, count in rows}
+        self.counts[None] = sum(count for _, count in rows)
+        self.reconciled_at = time.time()
+
+    def change(self, category, delta):
+        with self.lock:
+            if self.counts is None:
+                return
+            for key in (None, str(category)):
+                self.counts[key] = self.counts.get(key, 0) + delta
+
+    '''
+    count(category_id)
+        returns number of questions in category,
+        or number of all questions if category id is None
+    '''
+    def count(self, category_id=None):
+        key = None if category_id is None else str(category_id)
+        with self.lock:
+            if self.counts is None or \
+                    time.time() - self.reconciled_at > RECONCILE_SECONDS:
+                self.reconcile()
+                self.misses += 1
+            else:
+                self.hits += 1
+            return self.counts.get(key, 0)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+question_counts = QuestionCounts()
+
+
+'''
+init_counts(app)
+    empties the counts, they are queried on first use
+'''
+def init_counts(app):
+    question_counts.reset()
+
+
+# keep counts up to date with questions changes
+@event.listens_for(Question, 'after_insert')
+def question_inserted(mapper, connection, question):
+    question_counts.change(question.category, 1)
+
+
+@event.listens_for(Question, 'after_delete')
+def question_deleted(mapper, connection, question):
+    question_counts.change(question.category, -1)
+
+
+# category of a question may have changed, count again
+@event.listens_for(Question, 'after_update')
+def question_updated(mapper, connection, question):
+    question_counts.reset()
+
+
+# a rolled back change may already be counted, count again
+@event.listens_for(db.session, 'after_soft_rollback')
+def session_rolled_back(session, previous_transaction):
+    question_counts.reset()
@@ -1,10 +1,18 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, Response
+from flask import stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, Question, Category
+from search import init_search, search_questions
+from quiz import init_quiz, question_pool, quiz_sessions
+from categories import init_categories, category_cache
+from counts import init_counts, question_counts
+from bulk import read_csv, read_ndjson, import_questions, export_questions
+from instrumentation import init_instrumentation
+from serializer import select_rows, format_rows, json_response
 
 QUESTIONS_PER_PAGE = 10
 
@@ -12,7 +20,20 @@ QUESTIONS_PER_PAGE = 10
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config:
+        app.config.from_mapping(test_config)
+    # database can be changed using SQLALCHEMY_DATABASE_URI in test_config
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+    init_search(app)
+    init_quiz(app)
+    init_categories(app)
+    init_counts(app)
+    # opt-in per request SQL and timing stats, Server-Timing and /metrics
+    if app.config.get('INSTRUMENTATION'):
+        init_instrumentation(app)
+    # opt-in fast path for questions lists, rows are selected as plain
+    # columns (no ORM objects) and serialized with orjson if installed
+    fast_json = app.config.get('FAST_JSON', False)
     cors = CORS(app, resources={r"/*": {"origins": "*"}})
 
     # CORS Headers
@@ -27,27 +48,59 @@ def create_app(test_config=None):
     # get categories list
     @app.route("/categories")
     def get_categories():
-        # query categories
-        categories_list = Category.query.all()
-        # create list of categories formatted, then return json response
-        categories = [cat.format() for cat in categories_list]
-        return jsonify({
-            'success': True,
-            'categories': categories
-        })
+        # categories response is serialized once and cached,
+        # until categories change
+        body, etag = category_cache.response_body()
+        response = Response(body, mimetype='application/json')
+        # clients send the etag back in If-None-Match,
+        # and get 304 (not modified) with empty body if nothing changed
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    # query of questions to list, column rows on the fast path
+    def questions_query():
+        if fast_json:
+            return select_rows(Question.query)
+        return Question.query
 
-    # helper method to paginate questions
+    # format questions (or column rows) of a page
+    def format_questions(questions):
+        if fast_json:
+            return format_rows(questions)
+        return [question.format() for question in questions]
+
+    # json response of a questions list
+    def questions_response(data):
+        if fast_json:
+            return json_response(data)
+        return jsonify(data)
+
+    # helper method to paginate questions inside the database,
+    # selection is a query ordered by id descending,
+    # only one page of rows is fetched, never the whole table
     def paginate_questions(request, selection):
-        # get page number from request, default is 1
-        page = request.args.get('page', 1, type=int)
-        # set start and end based on page number
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-        # get all questions from selection
-        questions = [question.format() for question in selection]
-        # get questions based on page number (start till end)
-        current_questions = questions[start:end]
-        return current_questions
+        # get last seen question id from request (keyset paging)
+        after_id = request.args.get('after_id', None, type=int)
+        if after_id is not None:
+            # continue after the last seen id,
+            # so page N costs the same as page 1
+            selection = selection.filter(Question.id < after_id)
+        else:
+            # get page number from request, default is 1
+            page = request.args.get('page', 1, type=int)
+            if page < 1:
+                return [], None
+            # skip questions of previous pages (offset paging)
+            selection = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+        # fetch one extra question to know if there is a next page
+        questions = selection.limit(QUESTIONS_PER_PAGE + 1).all()
+        current_questions = format_questions(questions[:QUESTIONS_PER_PAGE])
+        # cursor to be sent back as after_id to get the next page
+        next_cursor = None
+        if len(questions) > QUESTIONS_PER_PAGE:
+            next_cursor = current_questions[-1]['id']
+        return current_questions, next_cursor
 
     # this end point will read all questions, no category filter applied
     # for a specific category questions,
@@ -56,22 +109,23 @@ def create_app(test_config=None):
     def get_questions():
         # get all questions, ordered by id descending,
         # i.e the newest question is on top=+
-        questions_list = Question.query.order_by(Question.id.desc()).all()
-        # get selection based on page number
-        current_questions = paginate_questions(request, questions_list)
+        questions_list = questions_query().order_by(Question.id.desc())
+        # get selection based on page number or last seen id
+        current_questions, next_cursor = paginate_questions(
+            request, questions_list)
         # if current page has no questions, then return 404 (not found) error
         if len(current_questions) == 0:
             abort(404)
 
-        # get list of all categories
-        categories_list = Category.query.all()
-        categories = [cat.format() for cat in categories_list]
+        # get list of all categories, from cache
+        categories = category_cache.categories()
 
         # return json response
-        return jsonify({
+        return questions_response({
             'success': True,
             'questions': current_questions,
-            'total_questions': Question.query.count(),
+            'total_questions': question_counts.count(),
+            'next_cursor': next_cursor,
             'current_category': None,
             'categories': categories
         })
@@ -129,22 +183,56 @@ def create_app(test_config=None):
             }
         )
 
+    # end point to add many questions at once,
+    # body is JSON Lines (one question object per line),
+    # or CSV with a header line if content type is text/csv
+    @app.route('/questions/bulk', methods=['POST'])
+    def bulk_add_questions():
+        # read body line by line while inserting, not all at once
+        lines = (line.decode('utf-8') for line in request.stream)
+        if request.mimetype == 'text/csv':
+            rows = read_csv(lines)
+        else:
+            rows = read_ndjson(lines)
+        result = import_questions(rows)
+        # return json response with inserted count and rows errors
+        return jsonify({
+            'success': True,
+            **result.format()
+        })
+
+    # end point to download all questions as JSON Lines
+    @app.route('/questions/export')
+    def export_all_questions():
+        return Response(
+            stream_with_context(export_questions()),
+            mimetype='application/x-ndjson',
+            headers={
+                'Content-Disposition': 'attachment; filename=questions.jsonl'
+            })
+
     #  end point to search for a question
     @app.route('/search', methods=['POST'])
     def search_question():
         #  get search term from request
         term = request.get_json().get('searchTerm')
-        # get all questions, ordered by id descending,
-        # filtering by search term using ilike for case insensitive
-        questions_list = Question.query.order_by(Question.id.desc())\
-            .filter(Question.question.ilike('%{}%'.format(term))).all()
-        current_questions = paginate_questions(request, questions_list)
+        # get page number or last seen id, same as paginate_questions
+        page = request.args.get('page', 1, type=int)
+        after_id = request.args.get('after_id', None, type=int)
+        if page < 1:
+            abort(404)
+        # search question and answer using the full text search index,
+        # ranked by relevance, only the current page is fetched
+        result = search_questions(
+            term, page, after_id, QUESTIONS_PER_PAGE, questions_query())
+        current_questions = format_questions(result.questions)
 
         # return json response
-        return jsonify({
+        return questions_response({
             'success': True,
             'questions': current_questions,
-            'total_questions': len(current_questions)
+            'total_questions': result.total,
+            'next_cursor': result.next_cursor
         })
 
     # end point to get questions based on categories
@@ -152,20 +240,22 @@ def create_app(test_config=None):
     def get_category_questions(category_id):
         # get list of all questions filtered by category,
         # ordered by id descending,i.e the newest is on top
-        questions_list = Question.query\
+        questions_list = questions_query()\
             .filter(Question.category == category_id)\
             .order_by(Question.id.desc())
         # create paginating for questions
-        current_questions = paginate_questions(request, questions_list.all())
+        current_questions, next_cursor = paginate_questions(
+            request, questions_list)
         # if current page does not have questions, return not found error
         if len(current_questions) == 0:
             abort(404)
 
         # return json response for success
-        return jsonify({
+        return questions_response({
             'success': True,
             'questions': current_questions,
-            'total_questions': questions_list.count(),
+            'total_questions': question_counts.count(category_id),
+            'next_cursor': next_cursor,
             'current_category': category_id,
         })
 
@@ -179,24 +269,13 @@ def create_app(test_config=None):
             category = body.get('quiz_category', None)
             # get previous questions list
             previous_questions = body.get('previous_questions', None)
-            # get all questions to choose from
-            all_questions = Question.query
-            # if there is previous questions,
-            # then filter questions removing previous ones
-            if(previous_questions):
-                all_questions = all_questions\
-                    .filter(~ Question.id.in_(previous_questions))
-
             # check if a category is choosen,
             # i.e category id is larger than 0 (0 for all categories)
-            if(category['id'] > 0):
-                # if category is choosen,
-                # then filter question based on this category
-                question = all_questions\
-                    .filter(Question.category == category['id']).first()
-            else:
-                # no category is choosen, get first question
-                question = all_questions.first()
+            # then pick a random question, in category if choosen,
+            # that is not one of previous questions,
+            # from in-memory ids, no table scan and no NOT IN query
+            question = question_pool.random_question(
+                category['id'], previous_questions)
 
             # return json response for selected question
             return jsonify(
@@ -208,6 +287,49 @@ def create_app(test_config=None):
         except:
             abort(500)
 
+    # end point to start a quiz session,
+    # previous questions are kept by the server,
+    # so clients do not resend them for every question
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        body = request.get_json(silent=True) or {}
+        # get category if exist, 0 for all categories
+        category = body.get('quiz_category') or {}
+        try:
+            category_id = int(category.get('id', 0))
+        except (TypeError, ValueError, AttributeError):
+            abort(422)
+        session = quiz_sessions.create(category_id)
+        return jsonify({
+            'success': True,
+            **session.format()
+        })
+
+    # end point to get next question of a quiz session,
+    # a random question that was not played in this session
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def get_quiz_session_question(session_id):
+        # if session does not exist or expired, return 404 error
+        session = quiz_sessions.get(session_id)
+        if session is None:
+            abort(404)
+        question = session.next_question()
+        return jsonify({
+            'success': True,
+            'question': question.format() if question else None,
+            **session.format()
+        })
+
+    # end point to end a quiz session
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def delete_quiz_session(session_id):
+        if not quiz_sessions.delete(session_id):
+            abort(404)
+        return jsonify({
+            'success': True,
+            'deleted': session_id
+        })
+
     # error handler for 404 (Not Found)
     @app.errorhandler(404)
     def not_found(error):
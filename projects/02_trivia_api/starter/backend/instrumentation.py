@@ -0,0 +1,213 @@
+import threading
+import time
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+
+from models import db
+from categories import category_cache
+from counts import question_counts
+
+
+'''
+QueryBudgetExceeded
+    raised in testing mode when a request runs more SQL statements
+    than the QUERY_BUDGET configured for its route
+'''
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+'''
+RequestStats
+    what one request did: SQL statements count and time,
+    rows reported by the database driver, and json serialization time
+'''
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.serialize_seconds = 0.0
+
+    def server_timing(self, total_seconds):
+        return 'db;dur={:.2f};desc="{} queries, {} rows", ' \
+            'serialize;dur={:.2f}, total;dur={:.2f}'.format(
+                self.db_seconds * 1000, self.statements, self.rows,
+                self.serialize_seconds * 1000, total_seconds * 1000)
+
+
+'''
+Metrics
+    totals per route, method and status since the server started,
+    and hits and misses of caches (objects with stats()) by name,
+    rendered in Prometheus text format
+'''
+class Metrics:
+    COUNTERS = [
+        ('requests_total', 'counter', 'Requests handled'),
+        ('request_duration_seconds_total', 'counter',
+         'Time spent handling requests'),
+        ('db_statements_total', 'counter', 'SQL statements run'),
+        ('db_duration_seconds_total', 'counter',
+         'Time spent running SQL statements'),
+        ('db_rows_total', 'counter',
+         'Rows reported by the database driver'),
+        ('serialize_duration_seconds_total', 'counter',
+         'Time spent serializing json responses'),
+    ]
+    CACHE_COUNTERS = [
+        ('cache_hits_total', 'hits', 'Lookups answered from the cache'),
+        ('cache_misses_total', 'misses',
+         'Lookups that built the cache again'),
+    ]
+
+    def __init__(self, prefix='trivia_', caches=None):
+        self.lock = threading.Lock()
+        self.prefix = prefix
+        self.series = {}
+        self.caches = caches or {}
+
+    def record(self, route, method, status, stats, total_seconds):
+        values = (1, total_seconds, stats.statements, stats.db_seconds,
+                  stats.rows, stats.serialize_seconds)
+        with self.lock:
+            totals = self.series.setdefault(
+                (route, method, str(status)), [0] * len(values))
+            for index, value in enumerate(values):
+                totals[index] += value
+
+    def render(self):
+        lines = []
+        with self.lock:
+            series = sorted(self.series.items())
+        for index, (name, kind, description) in enumerate(self.COUNTERS):
+            name = self.prefix + name
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for (route, method, status), totals in series:
+                lines.append(
+                    '{}{{route="{}",method="{}",status="{}"}} {}'.format(
+                        name, route.replace('"', '\\"'), method, status,
+                        totals[index]))
+        caches = [(cache_name, cache.stats())
+                  for cache_name, cache in sorted(self.caches.items())]
+        for name, key, description in self.CACHE_COUNTERS:
+            name = self.prefix + name
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} counter'.format(name))
+            for cache_name, stats in caches:
+                lines.append('{}{{cache="{}"}} {}'.format(
+                    name, cache_name, stats[key]))
+        return '\n'.join(lines) + '\n'
+
+
+def current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+# SQL statements timing, for the request running them
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    started = conn.info['query_started'].pop()
+    stats = current_stats()
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.db_seconds += time.perf_counter() - started
+    # number of rows, when the driver reports it (psycopg2 does,
+    # sqlite3 does not for SELECT)
+    if cursor.rowcount and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+# statement failed, after_cursor_execute will not run for it
+def handle_error(exception_context):
+    started = exception_context.connection.info.get('query_started')
+    if started:
+        started.pop()
+
+
+'''
+route_budget(budget, rule, endpoint)
+    QUERY_BUDGET is a number of statements for all routes,
+    or a dict of route rule (or endpoint name) to number of statements
+'''
+def route_budget(budget, rule, endpoint):
+    if isinstance(budget, dict):
+        return budget.get(rule, budget.get(endpoint))
+    return budget
+
+
+'''
+init_instrumentation(app)
+    records per request SQL statements, DB time, rows and serialization
+    time, sends them in a Server-Timing header,
+    and adds /metrics in Prometheus text format,
+    with hits and misses of the categories and question counts caches.
+    in testing mode, a request over QUERY_BUDGET raises QueryBudgetExceeded
+'''
+def init_instrumentation(app):
+    metrics = Metrics(caches={
+        'categories': category_cache,
+        'question_counts': question_counts,
+    })
+    app.extensions['metrics'] = metrics
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute',
+                          before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(engine, 'handle_error', handle_error)
+
+    # time spent by jsonify encoding response data
+    class TimedJSONEncoder(app.json_encoder):
+        def encode(self, o):
+            started = time.perf_counter()
+            try:
+                return super().encode(o)
+            finally:
+                stats = current_stats()
+                if stats is not None:
+                    stats.serialize_seconds += time.perf_counter() - started
+
+    app.json_encoder = TimedJSONEncoder
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        total_seconds = time.perf_counter() - stats.started
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        response.headers['Server-Timing'] = stats.server_timing(total_seconds)
+        metrics.record(
+            rule, request.method, response.status_code, stats, total_seconds)
+
+        budget = route_budget(
+            app.config.get('QUERY_BUDGET'), rule, request.endpoint)
+        if budget is not None and stats.statements > budget:
+            message = '{} {} ran {} SQL statements, budget is {}'.format(
+                request.method, rule, stats.statements, budget)
+            if app.testing:
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+        return response
+
+    @app.route('/metrics')
+    def get_metrics():
+        return Response(
+            metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,269 @@
+import random
+import secrets
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from sqlalchemy import event
+
+from models import db, Question
+
+# random picks tried before switching to the exact method,
+# a pick only misses when it lands on a previous question
+SAMPLE_TRIES = 16
+# ids of questions added or removed by other server processes
+# are picked up when the pool is built again
+REFRESH_SECONDS = 300
+# quiz sessions not used for this long are removed
+SESSION_TTL_SECONDS = 30 * 60
+# oldest sessions are removed when there are more than this
+MAX_SESSIONS = 100000
+
+
+'''
+QuestionPool
+    in-memory arrays of question ids, one for all questions,
+    and one per category, used to pick a random question
+    without querying the questions table
+'''
+class QuestionPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = None
+        self.positions = None
+        self.built_at = 0
+
+    def reset(self):
+        # pool is built again on next pick
+        with self.lock:
+            self.ids = None
+            self.positions = None
+
+    def build(self):
+        self.ids = {None: []}
+        self.positions = {None: {}}
+        rows = db.session.query(Question.id, Question.category)\
+            .yield_per(1000)
+        for q_id, category in rows:
+            self.add_id(q_id, category)
+        self.built_at = time.time()
+
+    def add_id(self, q_id, category):
+        for key in (None, str(category)):
+            ids = self.ids.setdefault(key, [])
+            positions = self.positions.setdefault(key, {})
+            if q_id not in positions:
+                positions[q_id] = len(ids)
+                ids.append(q_id)
+
+    def remove_id(self, q_id):
+        for key, positions in self.positions.items():
+            if q_id not in positions:
+                continue
+            # move last id to the removed one's place, O(1) removal
+            ids = self.ids[key]
+            index = positions.pop(q_id)
+            last = ids.pop()
+            if last != q_id:
+                ids[index] = last
+                positions[last] = index
+
+    def add(self, question):
+        with self.lock:
+            if self.ids is not None:
+                self.remove_id(question.id)
+                self.add_id(question.id, question.category)
+
+    def remove(self, question):
+        with self.lock:
+            if self.ids is not None:
+                self.remove_id(question.id)
+
+    def pick_id(self, category, seen):
+        with self.lock:
+            if self.ids is None or \
+                    time.time() - self.built_at > REFRESH_SECONDS:
+                self.build()
+            ids = self.ids.get(category, [])
+            if not ids:
+                return None
+            # random id, retry if it is a previous question,
+            # almost always done in the first try
+            for _ in range(SAMPLE_TRIES):
+                q_id = ids[random.randrange(len(ids))]
+                if q_id not in seen:
+                    return q_id
+            # most questions were seen, pick the r-th unseen id directly,
+            # cost depends on number of seen ids, not on pool size
+            positions = self.positions[category]
+            seen_positions = sorted(
+                positions[q_id] for q_id in seen if q_id in positions)
+            unseen = len(ids) - len(seen_positions)
+            if unseen == 0:
+                return None
+            index = random.randrange(unseen)
+            for position in seen_positions:
+                if position <= index:
+                    index += 1
+            return ids[index]
+
+    '''
+    random_question(category_id, previous_questions)
+        returns a random question not in previous questions
+        (a list of ids, or SeenQuestions of a quiz session),
+        in category (all categories if category id is 0),
+        or None if all questions were played
+    '''
+    def random_question(self, category_id, previous_questions):
+        category = str(category_id) if category_id else None
+        seen = previous_questions
+        if not isinstance(seen, SeenQuestions):
+            seen = set(previous_questions or ())
+        while True:
+            q_id = self.pick_id(category, seen)
+            if q_id is None:
+                return None
+            question = Question.query.get(q_id)
+            if question:
+                return question
+            # question was deleted by another process
+            with self.lock:
+                if self.ids is not None:
+                    self.remove_id(q_id)
+
+
+question_pool = QuestionPool()
+
+
+'''
+SeenQuestions
+    ids of played questions, kept sorted in a compact array of ints
+    (8 bytes per id), membership is a binary search
+'''
+class SeenQuestions:
+    def __init__(self):
+        self.ids = array('q')
+
+    def add(self, q_id):
+        index = bisect_left(self.ids, q_id)
+        if index == len(self.ids) or self.ids[index] != q_id:
+            self.ids.insert(index, q_id)
+
+    def __contains__(self, q_id):
+        index = bisect_left(self.ids, q_id)
+        return index < len(self.ids) and self.ids[index] == q_id
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+'''
+QuizSession
+    a quiz being played, its category and the questions already played
+'''
+class QuizSession:
+    def __init__(self, session_id, category_id):
+        self.id = session_id
+        self.category_id = category_id
+        self.seen = SeenQuestions()
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+
+    '''
+    next_question()
+        returns a random question not played in this session,
+        and marks it as played, or None if all questions were played
+    '''
+    def next_question(self):
+        with self.lock:
+            question = question_pool.random_question(
+                self.category_id, self.seen)
+            if question:
+                self.seen.add(question.id)
+            return question
+
+    def format(self):
+        return {
+            'session_id': self.id,
+            'quiz_category': self.category_id,
+            'questions_played': len(self.seen)
+        }
+
+
+'''
+QuizSessionStore
+    quiz sessions of this server process, ordered by last use,
+    so expired sessions are always at the front and removed cheaply
+'''
+class QuizSessionStore:
+    def __init__(self, ttl=SESSION_TTL_SECONDS, max_sessions=MAX_SESSIONS):
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+
+    def evict(self, now):
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if len(self.sessions) <= self.max_sessions and \
+                    now - session.last_used <= self.ttl:
+                break
+            self.sessions.popitem(last=False)
+
+    def create(self, category_id):
+        session = QuizSession(secrets.token_urlsafe(16), category_id)
+        with self.lock:
+            self.sessions[session.id] = session
+            self.evict(session.last_used)
+        return session
+
+    '''
+    get(session_id)
+        returns the quiz session, or None if it does not exist or expired
+    '''
+    def get(self, session_id):
+        now = time.time()
+        with self.lock:
+            self.evict(now)
+            session = self.sessions.get(session_id)
+            if session:
+                session.last_used = now
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+
+quiz_sessions = QuizSessionStore()
+
+
+'''
+init_quiz(app)
+    empties the question pool, it is built on first quiz question
+'''
+def init_quiz(app):
+    question_pool.reset()
+
+
+# keep the pool up to date with questions changes
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+def question_saved(mapper, connection, question):
+    question_pool.add(question)
+
+
+@event.listens_for(Question, 'after_delete')
+def question_deleted(mapper, connection, question):
+    question_pool.remove(question)
+
+
+# a rolled back change may already be in the pool, build it again
+@event.listens_for(db.session, 'after_soft_rollback')
+def session_rolled_back(session, previous_transaction):
+    question_pool.reset()
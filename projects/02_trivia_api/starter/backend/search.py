@@ -0,0 +1,247 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from sqlalchemy import event, literal_column, func, or_, and_
+
+from models import db, Question
+from counts import question_counts
+
+# text searched for every question, question and answer columns together,
+# the GIN index below is built on exactly the same expression,
+# so PostgreSQL can use it to answer the @@ match
+SEARCH_VECTOR = "to_tsvector('simple', " \
+    "coalesce(questions.question, '') || ' ' || " \
+    "coalesce(questions.answer, ''))"
+SEARCH_INDEX = "CREATE INDEX IF NOT EXISTS ix_questions_search " \
+    "ON questions USING GIN (to_tsvector('simple', " \
+    "coalesce(question, '') || ' ' || coalesce(answer, '')))"
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+'''
+tokenize(text)
+    splits a text into lower case words,
+    same rules as the 'simple' text search configuration of PostgreSQL
+'''
+def tokenize(text):
+    return WORD.findall((text or '').lower())
+
+
+'''
+SearchPage
+    one page of search results
+    questions: list of Question (or column rows), in rank order
+    total: number of all questions matching the search term
+    next_cursor: id to send as after_id to get next page, None on last page
+'''
+class SearchPage:
+    def __init__(self, questions, total, next_cursor):
+        self.questions = questions
+        self.total = total
+        self.next_cursor = next_cursor
+
+
+'''
+PostgresSearch
+    full text search using a tsvector GIN index,
+    each word of the search term matches as a prefix (who matches whose),
+    results are ranked by ts_rank, then newest first
+'''
+class PostgresSearch:
+    def setup(self):
+        # create the GIN index once, if it does not exist
+        db.session.execute(SEARCH_INDEX)
+        db.session.commit()
+
+    def search(self, words, offset, after_id, limit, selection):
+        vector = literal_column(SEARCH_VECTOR)
+        # words are made of \w characters only, safe to build tsquery
+        query = func.to_tsquery(
+            'simple', ' & '.join(word + ':*' for word in words))
+        rank = func.ts_rank(vector, query)
+        matches = selection.filter(vector.op('@@')(query))
+        total = matches.count()
+        selection = matches.order_by(rank.desc(), Question.id.desc())
+        if after_id is not None:
+            # keyset paging on (rank, id) of the last seen question
+            last_rank = db.session.query(rank)\
+                .filter(Question.id == after_id).as_scalar()
+            selection = selection.filter(or_(
+                rank < last_rank,
+                and_(rank == last_rank, Question.id < after_id)))
+        else:
+            selection = selection.offset(offset)
+        questions = selection.limit(limit + 1).all()
+        return questions, total
+
+
+'''
+MemorySearch
+    in-process inverted index, used when the database is not PostgreSQL
+    (i.e. SQLite test runs), maps every word to {question id: count},
+    kept up to date by Question insert, update and delete events
+'''
+class MemorySearch:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = None
+        self.documents = {}
+        self.words = []
+
+    def setup(self):
+        self.reset()
+
+    def reset(self):
+        # index is built again on next search
+        with self.lock:
+            self.postings = None
+            self.documents = {}
+            self.words = []
+
+    def build(self):
+        self.postings = {}
+        self.documents = {}
+        self.words = []
+        rows = db.session.query(
+            Question.id, Question.question, Question.answer).yield_per(1000)
+        for q_id, question, answer in rows:
+            self.add_words(q_id, question, answer, sort=False)
+        self.words = sorted(self.postings)
+
+    def add_words(self, q_id, question, answer, sort=True):
+        words = tokenize(question) + tokenize(answer)
+        self.documents[q_id] = set(words)
+        for word in words:
+            if word not in self.postings:
+                self.postings[word] = {}
+                if sort:
+                    insort(self.words, word)
+            ids = self.postings[word]
+            ids[q_id] = ids.get(q_id, 0) + 1
+
+    def add(self, question):
+        with self.lock:
+            if self.postings is None:
+                return
+            self.remove_id(question.id)
+            self.add_words(question.id, question.question, question.answer)
+
+    def remove(self, question):
+        with self.lock:
+            if self.postings is not None:
+                self.remove_id(question.id)
+
+    def remove_id(self, q_id):
+        for word in self.documents.pop(q_id, ()):
+            del self.postings[word][q_id]
+            if not self.postings[word]:
+                del self.postings[word]
+                del self.words[bisect_left(self.words, word)]
+
+    def prefix_matches(self, prefix):
+        # all indexed words starting with prefix, using the sorted word list
+        scores = {}
+        start = bisect_left(self.words, prefix)
+        for word in self.words[start:]:
+            if not word.startswith(prefix):
+                break
+            for q_id, count in self.postings[word].items():
+                scores[q_id] = scores.get(q_id, 0) + count
+        return scores
+
+    def search(self, words, offset, after_id, limit, selection):
+        with self.lock:
+            if self.postings is None:
+                self.build()
+            # every word of the search term must match, rank is total hits
+            scores = None
+            for word in words:
+                matches = self.prefix_matches(word)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {q_id: score + matches[q_id]
+                              for q_id, score in scores.items()
+                              if q_id in matches}
+        ranked = sorted(scores, key=lambda q_id: (-scores[q_id], -q_id))
+        if after_id is not None:
+            offset = ranked.index(after_id) + 1 \
+                if after_id in scores else len(ranked)
+        page_ids = ranked[offset:offset + limit + 1]
+        # fetch only the questions of this page
+        questions = selection.filter(Question.id.in_(page_ids)).all()
+        questions.sort(key=lambda question: page_ids.index(question.id))
+        return questions, len(ranked)
+
+
+memory_search = MemorySearch()
+search_engine = memory_search
+
+
+'''
+init_search(app)
+    picks the search engine based on the database of the app,
+    and prepares it (GIN index for PostgreSQL, empty inverted index otherwise)
+'''
+def init_search(app):
+    global search_engine
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            search_engine = PostgresSearch()
+        else:
+            search_engine = memory_search
+        search_engine.setup()
+
+
+'''
+search_questions(term, page, after_id, per_page, selection)
+    returns a SearchPage of questions matching the search term,
+    page is used for offset paging, after_id for keyset paging,
+    an empty search term matches all questions, a term without
+    words (i.e punctuation only) matches none,
+    selection is the Question query to fetch results with,
+    default is Question.query
+'''
+def search_questions(term, page=1, after_id=None, per_page=10,
+                     selection=None):
+    if selection is None:
+        selection = Question.query
+    words = tokenize(term)
+    if not words and (term or '').strip():
+        return SearchPage([], 0, None)
+    offset = (page - 1) * per_page
+    if words:
+        questions, total = search_engine.search(
+            words, offset, after_id, per_page, selection)
+    else:
+        selection = selection.order_by(Question.id.desc())
+        total = question_counts.count()
+        if after_id is not None:
+            selection = selection.filter(Question.id < after_id)
+        else:
+            selection = selection.offset(offset)
+        questions = selection.limit(per_page + 1).all()
+    next_cursor = None
+    if len(questions) > per_page:
+        questions = questions[:per_page]
+        next_cursor = questions[-1].id
+    return SearchPage(questions, total, next_cursor)
+
+
+# keep the in-process index up to date with questions changes
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+def question_saved(mapper, connection, question):
+    memory_search.add(question)
+
+
+@event.listens_for(Question, 'after_delete')
+def question_deleted(mapper, connection, question):
+    memory_search.remove(question)
+
+
+# a rolled back change may already be in the index, build it again
+@event.listens_for(db.session, 'after_soft_rollback')
+def session_rolled_back(session, previous_transaction):
+    memory_search.reset()
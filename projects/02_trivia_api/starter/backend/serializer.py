@@ -0,0 +1,58 @@
+import json
+import time
+from flask import Response
+
+from models import Question
+from instrumentation import current_stats
+
+# orjson is optional, much faster than the json module when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# same keys as Question.format()
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+QUESTION_COLUMNS = tuple(
+    getattr(Question, field) for field in QUESTION_FIELDS)
+
+
+'''
+select_rows(selection)
+    makes a Question query return plain column tuples,
+    no ORM objects are created for the rows
+'''
+def select_rows(selection):
+    return selection.with_entities(*QUESTION_COLUMNS)
+
+
+'''
+format_rows(rows)
+    formats column tuples of select_rows the same as Question.format()
+'''
+def format_rows(rows):
+    return [dict(zip(QUESTION_FIELDS, row)) for row in rows]
+
+
+'''
+dumps(data)
+    serializes data to json bytes, using orjson if it is installed
+'''
+def dumps(data):
+    started = time.perf_counter()
+    if orjson is not None:
+        body = orjson.dumps(data)
+    else:
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    stats = current_stats()
+    if stats is not None:
+        stats.serialize_seconds += time.perf_counter() - started
+    return body
+
+
+'''
+json_response(data)
+    same as jsonify(data), using the fast serializer
+'''
+def json_response(data):
+    return Response(dumps(data), mimetype='application/json')
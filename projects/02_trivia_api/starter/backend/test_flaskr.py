@@ -6,6 +6,8 @@ from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
 from models import setup_db, Question, Category
+from instrumentation import QueryBudgetExceeded
+from categories import category_cache
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -68,6 +70,31 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
 
+    # test get questions using keyset cursor (after_id),
+    # next page must continue after the last question of first page
+    def test_get_questions_after_id(self):
+        res = self.client().get('/questions')
+        first_page = json.loads(res.data)
+        res = self.client().get(
+            '/questions?after_id={}'.format(first_page['next_cursor']))
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['questions']))
+        self.assertTrue(
+            data['questions'][0]['id'] < first_page['questions'][-1]['id'])
+        self.assertEqual(data['questions'], json.loads(
+            self.client().get('/questions?page=2').data)['questions'])
+
+    # test get questions after the last question id,
+    # should return 404 resource not found error
+    def test_404_after_id_not_found(self):
+        res = self.client().get('/questions?after_id=1')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
     # test for get categories list
     def test_get_categories(self):
         res = self.client().get('/categories')
@@ -76,6 +103,29 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['categories']))
 
+    # test categories list sent again with its etag,
+    # should return 304 not modified with empty body
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers.get('ETag'))
+        res = self.client().get(
+            '/categories', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    # test cached categories changed by a caller,
+    # later requests should get the categories unchanged
+    def test_cached_categories_copy(self):
+        categories = category_cache.categories()
+        categories[0]['type'] = 'Changed'
+        categories.append({'id': 0, 'type': 'Added'})
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+        types = [category['type'] for category in data['categories']]
+        self.assertNotIn('Changed', types)
+        self.assertNotIn('Added', types)
+
     #  test post to categories, return 405 not allowed
     def test_post_categories_405_not_allowed(self):
         res = self.client().post('/categories')
@@ -111,6 +161,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['inserted'])
 
+    # test total questions count is updated when a question is added
+    def test_add_new_question_total(self):
+        res = self.client().get('/categories/1/questions')
+        total = json.loads(res.data)['total_questions']
+        self.client().post('/questions', json=self.new_question)
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], total + 1)
+
     # test 422 for try to add question with not all fields provided
     def test_add_new_question_failure(self):
         res = self.client().post('/questions', json=self.bad_new_question)
@@ -119,6 +179,61 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'unprocessable')
 
+    # test add questions in bulk from JSON Lines,
+    # invalid rows are reported with their line number
+    def test_bulk_add_questions(self):
+        body = '\n'.join([
+            json.dumps(self.new_question),
+            json.dumps(self.bad_new_question),
+            json.dumps(self.new_question)])
+        res = self.client().post(
+            '/questions/bulk', data=body,
+            content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['errors'][0]['line'], 2)
+
+    # test add questions in bulk when one row of a batch can not be
+    # inserted, other rows of the batch are inserted
+    def test_bulk_add_questions_failed_row(self):
+        too_difficult = dict(self.new_question, difficulty=10 ** 20)
+        body = '\n'.join([
+            json.dumps(self.new_question),
+            json.dumps(too_difficult),
+            json.dumps(self.new_question)])
+        res = self.client().post(
+            '/questions/bulk', data=body,
+            content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['errors'], [
+            {'line': 2, 'message': 'could not be inserted'}])
+
+    # test add questions in bulk from CSV
+    def test_bulk_add_questions_csv(self):
+        body = 'question,answer,difficulty,category\n' \
+            'Test Question,Test Answer,1,1\n'
+        res = self.client().post(
+            '/questions/bulk', data=body, content_type='text/csv')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['failed'], 0)
+
+    # test export questions, one json question per line
+    def test_export_questions(self):
+        res = self.client().get('/questions/export')
+        lines = res.data.decode('utf-8').splitlines()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertTrue(len(lines))
+        self.assertIn('question', json.loads(lines[0]))
+
     # test delete question
     def test_delete_question(self):
         # try to get last question, then try to delete
@@ -146,6 +261,24 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['question'])
 
+    # test quiz question is never one of previous questions,
+    # and is None when all category questions were played
+    def test_get_quiz_not_previous(self):
+        res = self.client().get('/categories/1/questions')
+        ids = [q['id'] for q in json.loads(res.data)['questions']]
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1},
+            'previous_questions': ids[1:]})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], ids[0])
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1},
+            'previous_questions': ids})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question'], None)
+
     # test get quiz using get, return 405 not allowed
     def test_get_quiz_question_error_405(self):
         res = self.client().get('/quizzes')
@@ -154,6 +287,36 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'method not allowed')
 
+    # test quiz session, questions are never repeated in a session,
+    # and question is None when all category questions were played
+    def test_quiz_session(self):
+        res = self.client().post(
+            '/quizzes/sessions', json={'quiz_category': {'id': 1}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['session_id'])
+        url = '/quizzes/sessions/{}/next'.format(data['session_id'])
+        played = []
+        while True:
+            res = self.client().post(url)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if data['question'] is None:
+                break
+            self.assertNotIn(data['question']['id'], played)
+            played.append(data['question']['id'])
+        self.assertTrue(len(played))
+        self.assertEqual(data['questions_played'], len(played))
+
+    # test next question of a session that does not exist, return 404
+    def test_quiz_session_404(self):
+        res = self.client().post('/quizzes/sessions/nosession/next')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
     # test search questions
     def test_search_question(self):
         res = self.client().post('/search', json={'searchTerm': 'who'})
@@ -163,6 +326,26 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue(data['total_questions'])
 
+    # test search matches answers too,
+    # total questions is the count of all matches, not just this page
+    def test_search_question_answer(self):
+        res = self.client().post('/search', json={'searchTerm': 'escher'})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn('Escher', [q['answer'] for q in data['questions']])
+        self.assertTrue(data['total_questions'] >= len(data['questions']))
+
+    # test search with a term without words, matches no questions
+    def test_search_question_punctuation(self):
+        res = self.client().post('/search', json={'searchTerm': '!!!'})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['questions'], [])
+        self.assertEqual(data['total_questions'], 0)
+        self.assertEqual(data['next_cursor'], None)
+
     # test search using get, return 405 not allowed
     def test_get_search_question_error_405(self):
         res = self.client().get('/search')
@@ -171,6 +354,122 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'method not allowed')
 
+
+class InstrumentationTestCase(unittest.TestCase):
+    """This class represents the per request instrumentation test case"""
+
+    # SQL statements each route may run, caches built on first use included
+    QUERY_BUDGET = {
+        '/questions': 3,
+        '/categories': 1,
+        '/categories/<int:category_id>/questions': 2,
+        '/search': 2,
+        '/quizzes': 2,
+    }
+
+    def setUp(self):
+        """Define test variables and initialize app with instrumentation."""
+        self.database_path = "postgresql://{}:{}@{}/{}".format(
+            'khairallah', 'Najdawi', 'localhost:5432', 'trivia_test')
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': self.database_path,
+            'TESTING': True,
+            'INSTRUMENTATION': True,
+            'QUERY_BUDGET': self.QUERY_BUDGET,
+        })
+        self.client = self.app.test_client
+
+    # test routes stay within their query budget,
+    # a request over budget raises QueryBudgetExceeded and fails the test
+    def test_query_budget(self):
+        self.client().get('/questions')
+        self.client().get('/categories')
+        self.client().get('/categories/1/questions')
+        self.client().post('/search', json={'searchTerm': 'who'})
+        self.client().post('/quizzes', json={'quiz_category': {'id': 1}})
+
+    # test query budget exceeded, raises QueryBudgetExceeded
+    def test_query_budget_exceeded(self):
+        self.app.config['QUERY_BUDGET'] = 0
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client().get('/questions?page=2')
+
+    # test Server-Timing header with db and serialization time
+    def test_server_timing(self):
+        res = self.client().get('/questions')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+        self.assertIn('serialize;dur=', res.headers['Server-Timing'])
+
+    # test metrics in prometheus text format
+    def test_metrics(self):
+        self.client().get('/questions')
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/plain')
+        self.assertIn(
+            'trivia_requests_total{route="/questions",method="GET"',
+            res.data.decode('utf-8'))
+
+    # test cache hits and misses in metrics
+    def test_metrics_caches(self):
+        self.client().get('/categories')
+        self.client().get('/categories')
+        stats = category_cache.stats()
+        res = self.client().get('/metrics')
+        metrics = res.data.decode('utf-8')
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertIn('trivia_cache_hits_total{{cache="categories"}} {}\n'
+                      .format(stats['hits']), metrics)
+        self.assertIn('trivia_cache_misses_total{{cache="categories"}} {}\n'
+                      .format(stats['misses']), metrics)
+        self.assertIn('trivia_cache_hits_total{cache="question_counts"} ',
+                      metrics)
+
+
+class FastJSONTestCase(unittest.TestCase):
+    """This class represents the fast json serialization path test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app with and without it."""
+        self.database_path = "postgresql://{}:{}@{}/{}".format(
+            'khairallah', 'Najdawi', 'localhost:5432', 'trivia_test')
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': self.database_path,
+            'FAST_JSON': True,
+        })
+        self.default_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': self.database_path,
+        })
+        self.client = self.app.test_client
+        self.default_client = self.default_app.test_client
+
+    # test fast path returns the same data as the default path
+    def test_same_response(self):
+        for path in ['/questions', '/questions?page=2',
+                     '/categories/1/questions']:
+            res = self.client().get(path)
+            default = self.default_client().get(path)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.mimetype, 'application/json')
+            self.assertEqual(json.loads(res.data), json.loads(default.data))
+
+    # test search using the fast path
+    def test_search_question(self):
+        res = self.client().post('/search', json={'searchTerm': 'who'})
+        default = self.default_client().post(
+            '/search', json={'searchTerm': 'who'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), json.loads(default.data))
+
+    # test fast path keeps not found errors
+    def test_404_page_number_not_found(self):
+        res = self.client().get('/questions?page=1000')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+
 #  Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,115 @@
+import argparse
+import base64
+import json
+import os
+import tempfile
+import time
+from flask import Flask
+from jose import jwt
+
+# pycryptodome (requirements.txt) or the rsa package to make a signing key
+try:
+    from Crypto.PublicKey import RSA
+except ImportError:
+    RSA = None
+    import rsa
+
+
+def b64(number):
+    return base64.urlsafe_b64encode(number.to_bytes(
+        (number.bit_length() + 7) // 8, 'big')).rstrip(b'=').decode()
+
+
+# private key (PEM) and public JWK of a new RS256 signing key
+def signing_key(kid):
+    if RSA is not None:
+        key = RSA.generate(2048)
+        pem, n, e = key.export_key().decode(), key.n, key.e
+    else:
+        public, private = rsa.newkeys(2048)
+        pem, n, e = private.save_pkcs1().decode(), public.n, public.e
+    return pem, {'kty': 'RSA', 'kid': kid, 'use': 'sig',
+                 'n': b64(n), 'e': b64(e)}
+
+
+# milliseconds p50 and p99 of run() over rounds
+def measure(run, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='auth overhead per request, token cache cold and warm')
+    parser.add_argument('--rounds', type=int, default=500)
+    parser.add_argument('--permissions', type=int, default=1000,
+                        help='number of permissions in the token')
+    args = parser.parse_args()
+
+    # offline signing keys, see JWKS_SOURCE in src/auth/auth.py
+    pem, jwk = signing_key('bench')
+    jwks_path = os.path.join(tempfile.gettempdir(), 'coffee_bench_jwks.json')
+    with open(jwks_path, 'w') as jwks_file:
+        json.dump({'keys': [jwk]}, jwks_file)
+    os.environ['JWKS_SOURCE'] = jwks_path
+    from src.auth import auth
+
+    token = jwt.encode({
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'aud': auth.API_AUDIENCE,
+        'sub': 'bench',
+        'exp': int(time.time()) + 3600,
+        'permissions': ['perm:{}'.format(n) for n in range(
+            args.permissions)] + ['get:drinks-detail', 'post:drinks']
+    }, pem, algorithm='RS256', headers={'kid': 'bench'})
+
+    app = Flask(__name__)
+    headers = {'Authorization': 'Bearer ' + token}
+
+    required = ['post:drinks', 'get:drinks-detail']
+    rule = auth.PermissionRule.compile(all_of=required)
+
+    # the auth part of a request to a route using requires_auth
+    def request_auth():
+        with app.test_request_context(headers=headers):
+            payload, permissions = auth.verify_token(
+                auth.get_token_auth_header())
+            auth.check_permissions(rule, payload, permissions)
+
+    def cold():
+        auth.token_cache.clear()
+        request_auth()
+
+    # load the keys once, so cold rounds do not include it
+    request_auth()
+    cold_p50, cold_p99 = measure(cold, args.rounds)
+    warm_p50, warm_p99 = measure(request_auth, args.rounds)
+    print('{} rounds, rsa {}'.format(
+        args.rounds, 'pycryptodome' if RSA is not None else 'rsa'))
+    print('{:>6} {:>10} {:>10}'.format('cache', 'p50 ms', 'p99 ms'))
+    print('{:>6} {:>10.3f} {:>10.3f}'.format('cold', cold_p50, cold_p99))
+    print('{:>6} {:>10.3f} {:>10.3f}'.format('warm', warm_p50, warm_p99))
+    print('speedup {:.1f}x, {}'.format(
+        cold_p50 / warm_p50, auth.token_cache.stats()))
+
+    # permission check alone, a scan of the permissions list
+    # against the compiled rule and the token permission set
+    payload, permissions = auth.verify_token(token)
+    scan = measure(lambda: [
+        all(p in payload['permissions'] for p in required)
+        for _ in range(100)], args.rounds)[0] * 10
+    compiled = measure(lambda: [
+        auth.check_permissions(rule, payload, permissions)
+        for _ in range(100)], args.rounds)[0] * 10
+    print('permission check, {} permissions: list scan {:.2f} us, '
+          'compiled {:.2f} us'.format(
+              len(permissions), scan, compiled))
+
+
+if __name__ == "__main__":
+    main()
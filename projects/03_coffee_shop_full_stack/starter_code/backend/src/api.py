@@ -1,10 +1,12 @@
 import os
-from flask import Flask, request, jsonify, abort
+import threading
+import time
+from flask import Flask, Response, request, jsonify, abort, stream_with_context
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, db, Drink, MenuVersion, menu_listeners
 from .auth.auth import AuthError, requires_auth
 
 app = Flask(__name__)
@@ -18,6 +20,94 @@ CORS(app)
 '''
 # db_drop_and_create_all()
 
+# the menu version stamp, databases created before it was added do not have its table
+MenuVersion.__table__.create(db.engine, checkfirst=True)
+
+# seconds the menu version stamp is trusted without reading it again (0 reads it on each request),
+# seconds between version checks of the menu events stream, and seconds a stream lasts
+# before it ends and the client reconnects (so a worker thread is not held forever)
+MENU_CHECK_SECONDS = float(os.environ.get('MENU_CHECK_SECONDS', 0))
+MENU_EVENTS_SECONDS = float(os.environ.get('MENU_EVENTS_SECONDS', 5))
+MENU_EVENTS_MAX_SECONDS = float(os.environ.get('MENU_EVENTS_MAX_SECONDS', 300))
+
+## Menu Cache
+'''
+MenuCache(check_seconds)
+    the public menu (GET /drinks), the drinks short() list serialized once per menu version
+
+    the version stamp (MenuVersion) is read from the database, a single row lookup, instead of
+    every drink, so drinks changed by another worker process are served on the next request
+    (or check_seconds later). drinks changed by this process invalidate it at once,
+    Drink.insert(), update() and delete() call invalidate()
+'''
+class MenuCache:
+    def __init__(self, check_seconds=0):
+        self.check_seconds = check_seconds
+        self.lock = threading.Lock()
+        self.changed = threading.Condition()
+        # (stamp, etag, body) of the cached menu
+        self.menu = None
+        self.checked_at = None
+        self.invalidations = 0
+        self.builds = 0
+
+    '''
+    invalidate()
+        read the version stamp again on the next request, wake up the menu events streams
+    '''
+    def invalidate(self):
+        self.invalidations += 1
+        self.checked_at = None
+        with self.changed:
+            self.changed.notify_all()
+
+    '''
+    wait(timeout)
+        wait until the menu is invalidated by this process, or timeout seconds
+    '''
+    def wait(self, timeout):
+        with self.changed:
+            self.changed.wait(timeout)
+
+    # (version, updated_at) of the menu, outside of the request session so no transaction is kept open
+    def stamp(self):
+        with db.engine.connect() as connection:
+            return MenuVersion.current(connection)
+
+    @staticmethod
+    def etag(stamp):
+        version, updated_at = stamp
+        return '{}-{}'.format(version, updated_at.strftime('%Y%m%d%H%M%S%f') if updated_at else 0)
+
+    '''
+    get()
+        (stamp, etag, body) of the current menu
+    '''
+    def get(self):
+        menu = self.menu
+        checked_at = self.checked_at
+        if menu is not None and checked_at is not None and \
+                time.monotonic() - checked_at < self.check_seconds:
+            return menu
+
+        invalidations = self.invalidations
+        # the stamp is read before the drinks, a menu is never cached with a newer stamp than its drinks
+        stamp = self.stamp()
+        with self.lock:
+            menu = self.menu
+            if menu is None or menu[0] != stamp:
+                drinks = [drink.short() for drink in Drink.query.order_by(Drink.id).all()]
+                body = json.dumps({'success': True, 'drinks': drinks})
+                menu = self.menu = (stamp, self.etag(stamp), body)
+                self.builds += 1
+            if invalidations == self.invalidations:
+                self.checked_at = time.monotonic()
+        return menu
+
+
+menu_cache = MenuCache(MENU_CHECK_SECONDS)
+menu_listeners.append(menu_cache.invalidate)
+
 ## ROUTES
 '''
 @TODO implement endpoint
@@ -26,7 +116,57 @@ CORS(app)
         it should contain only the drink.short() data representation
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
-'''
+        served from menu_cache, with an ETag, 304 if the client menu is current
+        no Last-Modified, its one second precision would 304 a menu changed in the same second
+'''
+@app.route('/drinks')
+def get_drinks():
+    stamp, etag, body = menu_cache.get()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # clients may keep the menu but must revalidate it
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+'''
+GET /drinks/events
+    a public Server-Sent Events stream, a "menu" event (id is the menu ETag) is sent
+    when the menu changes, and when the stream starts unless the client has it (Last-Event-ID),
+    then GET /drinks again
+    changes made by other worker processes are sent within MENU_EVENTS_SECONDS
+    the stream ends after MENU_EVENTS_MAX_SECONDS, the client reconnects after the retry delay
+'''
+@app.route('/drinks/events')
+def drinks_events():
+    last_event_id = request.headers.get('Last-Event-ID')
+
+    def events():
+        ends_at = time.monotonic() + MENU_EVENTS_MAX_SECONDS
+        etag = last_event_id
+        try:
+            yield 'retry: {}\n\n'.format(int(MENU_EVENTS_SECONDS * 1000))
+            while True:
+                stamp = menu_cache.stamp()
+                if menu_cache.etag(stamp) != etag:
+                    etag = menu_cache.etag(stamp)
+                    yield 'event: menu\nid: {}\ndata: {}\n\n'.format(
+                        etag, json.dumps({'version': stamp[0]}))
+                else:
+                    # keeps proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+                remaining = ends_at - time.monotonic()
+                if remaining <= 0:
+                    return
+                menu_cache.wait(min(MENU_EVENTS_SECONDS, remaining))
+        finally:
+            # the stream ended, or the client disconnected (GeneratorExit)
+            db.session.remove()
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 
 '''
@@ -1,13 +1,24 @@
 import json
+import os
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import KeyStore, JWKSError
+from .token_cache import TokenCache, permission_set
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
+# url or local file of the signing keys, a file lets tests run offline
+JWKS_SOURCE = os.environ.get(
+    'JWKS_SOURCE', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+# signing keys by kid, fetched once and refreshed in the background
+key_store = KeyStore(JWKS_SOURCE)
+# payloads of verified tokens, until they expire
+token_cache = TokenCache(int(os.environ.get('TOKEN_CACHE_SIZE', 10000)))
 
 ## AuthError Exception
 '''
@@ -31,21 +42,97 @@ class AuthError(Exception):
     return the token part of the header
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
+
+'''
+PermissionRule(all_of, any_of)
+    permissions required by a route, compiled once when the route is
+    declared: every permission of all_of, and one of any_of if not empty
+'''
+class PermissionRule:
+    def __init__(self, all_of=(), any_of=()):
+        self.all_of = frozenset(all_of)
+        self.any_of = frozenset(any_of)
+
+    '''
+    compile(permission, all_of, any_of)
+        rule of a permission string (i.e. 'post:drink'), or a list of
+        permissions all required, and more all_of and any_of permissions
+    '''
+    @classmethod
+    def compile(cls, permission='', all_of=(), any_of=()):
+        if isinstance(permission, PermissionRule):
+            return permission
+        if isinstance(permission, str):
+            permission = [permission] if permission else []
+        return cls(list(permission) + list(all_of), any_of)
+
+    def empty(self):
+        return not self.all_of and not self.any_of
+
+    # permissions is a set, so checks do not depend on its size
+    def allows(self, permissions):
+        return self.all_of <= permissions and \
+            (not self.any_of or not self.any_of.isdisjoint(permissions))
+
 
 '''
 @TODO implement check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'),
+            or a PermissionRule
         payload: decoded jwt payload
+        permissions: permission_set(payload), if already known
 
     it should raise an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
 '''
-def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+def check_permissions(permission, payload, permissions=None):
+    rule = PermissionRule.compile(permission)
+    if rule.empty():
+        return True
+    if permissions is None:
+        permissions = permission_set(payload)
+    if permissions is None:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    if not rule.allows(permissions):
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+    return True
 
 '''
 @TODO implement verify_decode_jwt(token) method
@@ -54,6 +141,7 @@ def check_permissions(permission, payload):
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        keys come from key_store (JWKS_SOURCE), not fetched per request
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -61,25 +149,93 @@ def check_permissions(permission, payload):
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+
+    try:
+        rsa_key = key_store.get_key(unverified_header['kid'])
+    except JWKSError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to load the signing keys.'
+        }, 503)
+    if rsa_key is None:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+
+    try:
+        return jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/'
+        )
+
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+
+'''
+verify_token(token)
+    verify_decode_jwt(token) once per token,
+    the payload is then read from token_cache until the token expires
+    returns (payload, permissions), see permission_set()
+'''
+def verify_token(token):
+    verified = token_cache.get(token)
+    if verified is None:
+        verified = token_cache.put(token, verify_decode_jwt(token))
+    return verified
 
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
         permission: string permission (i.e. 'post:drink')
+        all_of: permissions all required, i.e. ['patch:drinks', 'get:drinks-detail']
+        any_of: permissions one of them required
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        through verify_token, so a token is verified once
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
-def requires_auth(permission=''):
+def requires_auth(permission='', all_of=(), any_of=()):
+    # compiled once, not on every request
+    rule = PermissionRule.compile(permission, all_of, any_of)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload, permissions = verify_token(token)
+            check_permissions(rule, payload, permissions)
             return f(payload, *args, **kwargs)
 
         return wrapper
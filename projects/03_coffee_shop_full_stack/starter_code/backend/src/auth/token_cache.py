@@ -0,0 +1,101 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+permission_set(payload)
+    permissions claim of a payload as a frozenset,
+    None if the payload has no permissions claim
+'''
+def permission_set(payload):
+    permissions = payload.get('permissions')
+    if not isinstance(permissions, (list, tuple)):
+        return None
+    return frozenset(permissions)
+
+
+## Token Cache
+'''
+TokenCache(max_size)
+    payloads of verified tokens, keyed by the sha256 of the token,
+    so the same bearer token is verified (RS256 signature and claims)
+    once, not on every request, with their permission_set()
+
+    every caller gets its own copy of the payload,
+    so changing it does not change the cached one
+    a payload is kept until the token expires (its exp claim),
+    the least recently used ones are dropped over max_size
+    hits, misses and evictions are counted, see stats()
+'''
+class TokenCache:
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.payloads = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    '''
+    get(token)
+        (payload, permissions) of token if it was verified and has not
+        expired, else None
+    '''
+    def get(self, token):
+        key = self.key(token)
+        with self.lock:
+            cached = self.payloads.get(key)
+            if cached is not None:
+                if cached[0] > time.time():
+                    self.payloads.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(cached[1]), cached[2]
+                del self.payloads[key]
+            self.misses += 1
+        return None
+
+    '''
+    put(token, payload)
+        keep payload of a verified token until its exp claim,
+        returns (payload, permissions)
+    '''
+    def put(self, token, payload):
+        permissions = permission_set(payload)
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            return payload, permissions
+        key = self.key(token)
+        with self.lock:
+            self.payloads[key] = (
+                expires_at, copy.deepcopy(payload), permissions)
+            self.payloads.move_to_end(key)
+            while len(self.payloads) > self.max_size:
+                self.payloads.popitem(last=False)
+                self.evictions += 1
+        return payload, permissions
+
+    def clear(self):
+        with self.lock:
+            self.payloads.clear()
+
+    '''
+    stats()
+        hits, misses, evictions and size of the cache, and hit rate
+    '''
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.payloads),
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
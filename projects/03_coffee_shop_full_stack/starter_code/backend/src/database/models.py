@@ -1,5 +1,8 @@
 import os
-from sqlalchemy import Column, String, Integer
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime, JSON, event, select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import validates
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -29,6 +32,53 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+MenuVersion
+the version stamp of the drinks menu, a single row shared by every worker process
+bumped in the same transaction as each drink insert(), update() and delete()
+'''
+class MenuVersion(db.Model):
+    __tablename__ = 'menu_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    '''
+    bump()
+        increments the version in the current transaction, in sql so concurrent bumps are not lost
+    '''
+    @classmethod
+    def bump(cls):
+        bumped = db.session.query(cls).filter(cls.id == 1).update({
+            cls.version: cls.version + 1,
+            cls.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+        if not bumped:
+            db.session.add(cls(id=1, version=1))
+
+    '''
+    current(connection)
+        (version, updated_at) of the menu, (0, None) if it was never bumped
+    '''
+    @classmethod
+    def current(cls, connection):
+        row = connection.execute(select([cls.version, cls.updated_at]).where(cls.id == 1)).first()
+        return (row.version, row.updated_at) if row else (0, None)
+
+
+@event.listens_for(MenuVersion.__table__, 'after_create')
+def create_menu_version(target, connection, **kw):
+    connection.execute(target.insert(), id=1, version=0, updated_at=datetime.utcnow())
+
+
+# called after a drink is inserted, updated or deleted, see menu_cache in api.py
+menu_listeners = []
+
+def menu_changed():
+    for listener in menu_listeners:
+        listener()
+
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -38,33 +88,57 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients - a json column (jsonb on postgresql), parsed once when the row is loaded
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    recipe = Column(JSON().with_variant(JSONB, 'postgresql'), nullable=False)
+
+    '''
+    recipe
+        a list of ingredients, or a json string of it (parsed when it is set)
+    '''
+    @validates('recipe')
+    def validate_recipe(self, key, recipe):
+        if isinstance(recipe, str):
+            recipe = json.loads(recipe)
+        if isinstance(recipe, dict):
+            recipe = [recipe]
+        return recipe
+
+    '''
+    projection(form)
+        short() or long() representation, computed once per row version
+        the cached one is dropped when title or recipe is set, or the row is refreshed or expired
+        !!NOTE the returned dict is shared, do not modify it
+    '''
+    def projection(self, form):
+        projections = self.__dict__.setdefault('_projections', {})
+        if form not in projections:
+            recipe = self.recipe
+            if form == 'short':
+                recipe = [{'color': r['color'], 'parts': r['parts']} for r in recipe]
+            projections[form] = {
+                'id': self.id,
+                'title': self.title,
+                'recipe': recipe
+            }
+        return projections[form]
+
+    def clear_projections(self):
+        self.__dict__.pop('_projections', None)
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': short_recipe
-        }
+        return self.projection('short')
 
     '''
     long()
         long form representation of the Drink model
     '''
     def long(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': json.loads(self.recipe)
-        }
+        return self.projection('long')
 
     '''
     insert()
@@ -77,7 +151,9 @@ class Drink(db.Model):
     '''
     def insert(self):
         db.session.add(self)
+        MenuVersion.bump()
         db.session.commit()
+        menu_changed()
 
     '''
     delete()
@@ -89,7 +165,9 @@ class Drink(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
+        MenuVersion.bump()
         db.session.commit()
+        menu_changed()
 
     '''
     update()
@@ -101,7 +179,23 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
+        MenuVersion.bump()
         db.session.commit()
+        menu_changed()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+
+## Drink projections
+# a new row version drops the cached short() and long() of a drink
+@event.listens_for(Drink.title, 'set')
+@event.listens_for(Drink.recipe, 'set')
+def drink_changed(target, value, oldvalue, initiator):
+    target.clear_projections()
+
+
+@event.listens_for(Drink, 'refresh')
+@event.listens_for(Drink, 'expire')
+def drink_reloaded(target, *args):
+    target.clear_projections()
@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from src.database import models
+
+# a copy of the shipped database, so tests do not change it
+database_dir = tempfile.mkdtemp()
+shutil.copy(os.path.join(models.project_dir, models.database_filename),
+            database_dir)
+models.database_path = 'sqlite:///{}'.format(
+    os.path.join(database_dir, models.database_filename))
+
+from src import api
+from src.auth.token_cache import TokenCache
+from src.database.models import Drink
+
+
+class MenuTestCase(unittest.TestCase):
+    """This class represents the public menu test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.client = api.app.test_client
+
+    def tearDown(self):
+        """Executed after reach test"""
+        pass
+
+    # test get drinks on the shipped database,
+    # its menu version table is created on startup
+    def test_get_drinks(self):
+        res = self.client().get('/drinks')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIsInstance(data['drinks'], list)
+        self.assertTrue(res.headers['ETag'])
+        self.assertNotIn('Last-Modified', res.headers)
+
+    # test get drinks with the ETag of the current menu, 304 until it changes
+    def test_get_drinks_not_modified(self):
+        etag = self.client().get('/drinks').headers['ETag']
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        with api.app.app_context():
+            Drink(title='Menu Test Water', recipe=[
+                {'name': 'water', 'color': 'blue', 'parts': 1}]).insert()
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertIn('Menu Test Water',
+                      [drink['title'] for drink in data['drinks']])
+
+    # test menu events, the stream sends a retry delay and the menu,
+    # and ends after MENU_EVENTS_MAX_SECONDS
+    def test_drinks_events(self):
+        max_seconds = api.MENU_EVENTS_MAX_SECONDS
+        api.MENU_EVENTS_MAX_SECONDS = 0
+        try:
+            etag = self.client().get('/drinks').headers['ETag'].strip('"')
+            res = self.client().get('/drinks/events')
+            events = res.data.decode('utf-8')
+            res = self.client().get(
+                '/drinks/events', headers={'Last-Event-ID': etag})
+            known = res.data.decode('utf-8')
+        finally:
+            api.MENU_EVENTS_MAX_SECONDS = max_seconds
+        self.assertEqual(res.mimetype, 'text/event-stream')
+        self.assertTrue(events.startswith('retry: '))
+        self.assertIn('event: menu\nid: {}\n'.format(etag), events)
+        # the client already has the menu
+        self.assertNotIn('event: menu', known)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    # test a payload changed by a request,
+    # later requests should get the verified payload
+    def test_payload_copy(self):
+        cache = TokenCache()
+        payload = {'sub': 'barista', 'exp': time.time() + 60,
+                   'permissions': ['get:drinks-detail']}
+        verified, _ = cache.put('token', payload)
+        verified['permissions'].append('delete:drinks')
+        cached, permissions = cache.get('token')
+        cached['sub'] = 'manager'
+        cached, _ = cache.get('token')
+        self.assertEqual(cached['sub'], 'barista')
+        self.assertEqual(cached['permissions'], ['get:drinks-detail'])
+        self.assertEqual(permissions, frozenset(['get:drinks-detail']))
+        self.assertEqual(cache.stats()['hits'], 2)
+
+
+#  Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()